@@ -0,0 +1,138 @@
+import os
+from typing import Optional
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from backend import database as db
+from backend.entities import Chat, ChatSummary, Message
+
+# Async database path for routes migrated to ``async def``. The queries are
+# the ones in backend.database, run through AsyncSession.run_sync so the
+# sqlite round trips go through aiosqlite instead of holding a worker
+# thread. ORM objects cannot lazy load once run_sync returns, so these
+# functions hand back the detached response models instead.
+
+enabled = os.environ.get("ASYNC_DATABASE", default="0") == "1"
+database_url = os.environ.get(
+    "ASYNC_DATABASE_URL",
+    default=db.database_url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+)
+
+# aiosqlite is only needed (and imported) when the async path is enabled
+async_engine = (
+    db.build_engine(database_url, create=create_async_engine) if enabled else None
+)
+
+async def get_async_session():
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+#   -------- Chats --------   #
+
+async def get_all_chats(session: AsyncSession, user_id: int) -> list[Chat]:
+    """
+    Retrieve all chats of a user from the database.
+
+    :return: list of chats
+    """
+    def _get(sync_session):
+        chats = db.get_all_chats(sync_session, user_id)
+        return [Chat.model_validate(chat) for chat in chats]
+
+    return await session.run_sync(_get)
+
+async def get_recent_chats(session: AsyncSession, user_id: int,
+                           after: Optional[str] = None, limit: int = 50) -> db.ChatPage:
+    """
+    Retrieve a page of a users chats, most recently active first.
+
+    :return: page of chats with their last message and the next cursor
+    """
+    def _get(sync_session):
+        page = db.get_recent_chats(sync_session, user_id, after=after, limit=limit)
+        page.chats = [ChatSummary.model_validate(chat) for chat in page.chats]
+        return page
+
+    return await session.run_sync(_get)
+
+async def get_chat_versions(session: AsyncSession, user_id: int) -> list[tuple[int, int]]:
+    """
+    Retrieve the versions of all of a users chats.
+
+    :return: (chat id, version) pairs ordered by chat id
+    """
+    def _get(sync_session):
+        return [tuple(row) for row in db.get_chat_versions(sync_session, user_id)]
+
+    return await session.run_sync(_get)
+
+async def get_chat_by_id(session: AsyncSession, chat_id: int, user_id: int) -> Chat:
+    """
+    Retrieve a chat from the database.
+
+    :param chat_id: id of the chat to be retrieved
+    :return: the retrieved chat
+    """
+    def _get(sync_session):
+        return Chat.model_validate(db.get_chat_by_id(sync_session, chat_id, user_id))
+
+    return await session.run_sync(_get)
+
+async def get_chat_version(session: AsyncSession, chat_id: int, user_id: int) -> int:
+    """
+    Retrieve the version of a chat.
+
+    :param chat_id: id of the chat
+    :return: the current version
+    """
+    return await session.run_sync(db.get_chat_version, chat_id, user_id)
+
+#   -------- Messages --------   #
+
+async def get_chat_messages(session: AsyncSession, chat_id: int, user_id: int,
+                            before: Optional[str] = None, after: Optional[str] = None,
+                            limit: Optional[int] = None) -> db.MessagePage:
+    """
+    Retrieve a page of a chats messages from the database.
+
+    :param chat_id: id of the chat
+    :return: ordered page of chat messages with next/prev cursors
+    """
+    def _get(sync_session):
+        page = db.get_chat_messages(sync_session, chat_id, user_id,
+                                    before=before, after=after, limit=limit)
+        page.messages = [Message.model_validate(message) for message in page.messages]
+        return page
+
+    return await session.run_sync(_get)
+
+async def create_message(session: AsyncSession, chat_id: int,
+                         user_id: int, text: str) -> Message:
+    """
+    Adds a new message for the current user in the given chat.
+
+    :return: the newly added message
+    """
+    def _create(sync_session):
+        message = db.create_message(sync_session, chat_id, user_id, text)
+        return Message.model_validate(message)
+
+    return await session.run_sync(_create)
+
+async def update_message(session: AsyncSession, chat_id: int, message_id: int,
+                         message_update: db.MessageUpdate, user_id: int) -> Message:
+    """
+    Update a message in a chat.
+
+    :return: the updated message
+    """
+    def _update(sync_session):
+        message = db.update_message(sync_session, chat_id, message_id,
+                                    message_update, user_id)
+        return Message.model_validate(message)
+
+    return await session.run_sync(_update)
+
+async def delete_message(session: AsyncSession, chat_id: int,
+                         message_id: int, user_id: int):
+    """Delete a message by id from the database."""
+    await session.run_sync(db.delete_message, chat_id, message_id, user_id)
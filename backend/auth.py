@@ -1,21 +1,24 @@
 import os
 from datetime import datetime, timezone
-from typing import Annotated
+from typing import Annotated, Optional
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import (
     OAuth2PasswordBearer,
     OAuth2PasswordRequestForm,
 )
 from jose import ExpiredSignatureError, JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel, ValidationError
 from sqlmodel import Session, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
+from backend import async_database as adb
 from backend import database as db
+from backend import passwords
+from backend.cache import principal_cache
 from backend.entities import UserResponse, UserInDB, User
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 access_token_duration = 3600  # seconds
 jwt_alg = "HS256"
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
@@ -83,22 +86,23 @@ class DuplicateCredentials(HTTPException):
         )
 
 @auth_router.post("/registration", response_model=UserResponse, status_code=201)
-def register_new_user(
+async def register_new_user(
     registration: UserRegistration,
     session: Annotated[Session, Depends(db.get_session)],
 ):
     """Register new user."""
-    check_user_does_not_exist(session, registration.username, registration.email)
+    await run_in_threadpool(check_user_does_not_exist, session,
+                            registration.username, registration.email)
+    # hand the connection back to the pool while the password is hashed
+    await run_in_threadpool(session.close)
 
-    hashed_password = pwd_context.hash(registration.password)
+    hashed_password = await passwords.hash_password_async(registration.password)
     user = UserInDB(
         **registration.model_dump(),
         hashed_password=hashed_password,
     )
 
-    session.add(user)
-    session.commit()
-    session.refresh(user)
+    await run_in_threadpool(_save_user, session, user)
     return UserResponse(user=user)
 
 def check_user_does_not_exist(session, username, email):
@@ -116,12 +120,12 @@ def check_user_does_not_exist(session, username, email):
         raise DuplicateCredentials("email", email)
 
 @auth_router.post("/token", response_model=AccessToken)
-def get_access_token(
+async def get_access_token(
     form: OAuth2PasswordRequestForm = Depends(),
     session: Session = Depends(db.get_session),
 ):
     """Get access token for user."""
-    user = _get_authenticated_user(session, form)
+    user = await _get_authenticated_user(session, form)
     return _build_access_token(user)
 
 def _build_access_token(user: UserInDB) -> AccessToken:
@@ -135,19 +139,38 @@ def _build_access_token(user: UserInDB) -> AccessToken:
         expires_in=access_token_duration,
     )
 
-def _get_authenticated_user(
+async def _get_authenticated_user(
     session: Session,
     form: OAuth2PasswordRequestForm,
 ) -> UserInDB:
-    user = session.exec(
-        select(UserInDB).where(UserInDB.username == form.username)
-    ).first()
+    user = await run_in_threadpool(_get_user_by_username, session, form.username)
+    # every login waiting on the hashing pool would otherwise hold one of the
+    # connection pool's connections; the user stays loaded, just detached
+    await run_in_threadpool(session.close)
+    if user is None:
+        raise InvalidCredentials()
 
-    if user is None or not pwd_context.verify(form.password, user.hashed_password):
+    valid, new_hash = await passwords.verify_password(form.password, user.hashed_password)
+    if not valid:
         raise InvalidCredentials()
 
+    if new_hash is not None:
+        # stored with an outdated cost factor, upgrade it while we have the password
+        user.hashed_password = new_hash
+        await run_in_threadpool(_save_user, session, user)
+
     return user
 
+def _get_user_by_username(session: Session, username: str) -> UserInDB:
+    return session.exec(
+        select(UserInDB).where(UserInDB.username == username)
+    ).first()
+
+def _save_user(session: Session, user: UserInDB):
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
 def get_current_user(
     session: Session = Depends(db.get_session),
     token: str = Depends(oauth2_scheme),
@@ -156,20 +179,46 @@ def get_current_user(
     user = _decode_access_token(session, token)
     return user
 
-def _decode_access_token(session: Session, token: str) -> UserInDB:
-    try:
-        claims_dict = jwt.decode(token, key=jwt_key, algorithms=[jwt_alg])
-        claims = Claims(**claims_dict)
-        user_id = int(claims.sub)
-        user = session.get(UserInDB, user_id)
+async def get_current_user_async(
+    session: AsyncSession = Depends(adb.get_async_session),
+    token: str = Depends(oauth2_scheme),
+) -> UserInDB:
+    """get_current_user for the async routes, loading the user through aiosqlite."""
+    cached = principal_cache.get(token)
+    if cached is not None:
+        _claims, user = cached
+        return user
 
-        if user is None:
-            raise InvalidToken()
+    claims = _decode_claims(token)
+    user = await session.get(UserInDB, int(claims.sub))
+    return _cache_principal(token, claims, user)
 
+def _decode_access_token(session: Session, token: str) -> UserInDB:
+    cached = principal_cache.get(token)
+    if cached is not None:
+        _claims, user = cached
         return user
+
+    claims = _decode_claims(token)
+    user = session.get(UserInDB, int(claims.sub))
+    return _cache_principal(token, claims, user)
+
+def _decode_claims(token: str) -> Claims:
+    try:
+        claims_dict = jwt.decode(token, key=jwt_key, algorithms=[jwt_alg])
+        return Claims(**claims_dict)
     except ExpiredSignatureError:
         raise ExpiredToken()
     except JWTError:
         raise InvalidToken()
-    except ValidationError():
-        raise InvalidToken()
\ No newline at end of file
+    except ValidationError:
+        raise InvalidToken()
+
+def _cache_principal(token: str, claims: Claims, user: Optional[UserInDB]) -> UserInDB:
+    if user is None:
+        raise InvalidToken()
+
+    # detached copy, safe to share between requests and sessions
+    snapshot = UserInDB(**user.model_dump())
+    principal_cache.put(token, claims, snapshot, expires_at=claims.exp)
+    return snapshot
@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of authenticated principals keyed by access token.
+
+    Each entry holds the decoded claims and a detached snapshot of the user,
+    and expires after ttl seconds or when the token itself expires,
+    whichever comes first.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, Any, Any]] = OrderedDict()
+        self._tokens_by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[tuple[Any, Any]]:
+        """
+        Look up a token.
+
+        :param token: the access token
+        :return: the cached (claims, user), or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    self._evict(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, token: str, claims: Any, user: Any, expires_at: float):
+        """
+        Cache the principal of a token.
+
+        :param claims: decoded claims of the token
+        :param user: detached snapshot of the user the token belongs to
+        :param expires_at: unix timestamp at which the token expires
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if token in self._entries:
+                self._evict(token)
+            self._entries[token] = (min(expires_at, time.time() + self.ttl), claims, user)
+            self._tokens_by_user.setdefault(user.id, set()).add(token)
+            while len(self._entries) > self.maxsize:
+                self._evict(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user, e.g. after the user changed."""
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def _evict(self, token: str):
+        _, _, user = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user.id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user.id]
+
+principal_cache = PrincipalCache(
+    maxsize=int(os.environ.get("AUTH_CACHE_SIZE", default=10000)),
+    ttl=float(os.environ.get("AUTH_CACHE_TTL", default=60)),
+)
@@ -0,0 +1,188 @@
+import os
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional dependency, br is only offered when installed
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, zstd is only offered when installed
+    zstandard = None
+
+compression_minimum_size = int(os.environ.get("COMPRESSION_MINIMUM_SIZE", default=1024))
+gzip_level = int(os.environ.get("GZIP_LEVEL", default=6))
+brotli_quality = int(os.environ.get("BROTLI_QUALITY", default=4))
+zstd_level = int(os.environ.get("ZSTD_LEVEL", default=3))
+
+class GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+class BrotliEncoder:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+def choose_encoding(accept_encoding: str, available: list[str]) -> Optional[str]:
+    """
+    Pick the content coding for a response from an Accept-Encoding header.
+
+    :param accept_encoding: the request's Accept-Encoding header
+    :param available: codings the server can produce, most preferred first
+    :return: the highest weighted coding, ties going to the server's
+        preference, or None to send the body as is
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    best, best_weight = None, 0.0
+    for coding in available:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith("text/") or "json" in content_type
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with zstd, br or gzip, as negotiated with the
+    client. Bodies below minimum_size are sent as is, and streaming bodies
+    are compressed chunk by chunk as they are sent.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = compression_minimum_size,
+        gzip_level: int = gzip_level,
+        brotli_quality: int = brotli_quality,
+        zstd_level: int = zstd_level,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoders = {}
+        if zstandard is not None:
+            self.encoders["zstd"] = lambda: ZstdEncoder(zstd_level)
+        if brotli is not None:
+            self.encoders["br"] = lambda: BrotliEncoder(brotli_quality)
+        self.encoders["gzip"] = lambda: GzipEncoder(gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = choose_encoding(accept_encoding, list(self.encoders))
+        responder = _CompressionResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: Optional[str], middleware: CompressionMiddleware):
+        self._send = send
+        self._encoding = encoding
+        self._middleware = middleware
+        self._start: Optional[Message] = None
+        self._encoder = None
+        self._passthrough = False
+
+    async def send(self, message: Message):
+        if self._passthrough:
+            await self._send(message)
+        elif message["type"] == "http.response.start":
+            # held back until the first body chunk shows how big the body is
+            self._start = message
+            headers = MutableHeaders(raw=self._start["headers"])
+            if (
+                "content-encoding" in headers
+                or not _is_compressible(headers.get("content-type", ""))
+            ):
+                self._passthrough = True
+                await self._send(self._start)
+                return
+            headers.add_vary_header("Accept-Encoding")
+            if self._encoding is None:
+                self._passthrough = True
+                await self._send(self._start)
+        elif message["type"] == "http.response.body":
+            await self._send_body(message)
+        else:
+            await self._send(message)
+
+    async def _send_body(self, message: Message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._encoder is None:
+            if not more_body and len(body) < self._middleware.minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+
+            self._encoder = self._middleware.encoders[self._encoding]()
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self._encoding
+            if more_body:
+                del headers["content-length"]
+            else:
+                body = self._encoder.compress(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(body))
+                await self._send(self._start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            await self._send(self._start)
+
+        if more_body:
+            # flush so every chunk reaches the client as soon as it is sent
+            body = self._encoder.compress(body) + self._encoder.flush()
+        else:
+            body = self._encoder.compress(body) + self._encoder.finish()
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -1,7 +1,24 @@
-from datetime import datetime
-from sqlmodel import Session, SQLModel, create_engine, select
+import base64
+import binascii
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterator, Optional, Union
+from sqlalchemy import (
+    Engine, and_, case, column, delete, event, func, insert, table, text, tuple_, update,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import joinedload
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlmodel import Session, create_engine, select
 from fastapi import HTTPException
+from backend import events
+from backend import migrations
+from backend import query_stats
+from backend.cache import principal_cache
 from backend.entities import (
+    Message,
     UserInDB,
     UserCreate,
     ChatInDB,
@@ -10,17 +27,80 @@ from backend.entities import (
     UserUpdate,
     UserChatLinkInDB,
     MessageUpdate,
+    MessageChangeInDB,
 )
 
-# create database engine
-engine = create_engine(
-    "sqlite:///backend/pony_express.db",
-    echo=True,
-    connect_args={"check_same_thread": False},
-)
+database_url = os.environ.get("DATABASE_URL", default="sqlite:///backend/pony_express.db")
+# logs every statement, for debugging only; backend.query_stats counts and
+# times queries per request and logs the slow ones
+database_echo = os.environ.get("DATABASE_ECHO", default="0") == "1"
+database_pool_size = int(os.environ.get("DATABASE_POOL_SIZE", default=5))
+database_max_overflow = int(os.environ.get("DATABASE_MAX_OVERFLOW", default=10))
+# most messages accepted by one create_messages call
+message_batch_max = int(os.environ.get("MESSAGE_BATCH_MAX", default=500))
+# how long /sync clients may stay away before they must resync from scratch
+message_change_retention_days = int(os.environ.get("MESSAGE_CHANGE_RETENTION_DAYS", default=30))
+
+# applied to every new sqlite connection, in this order
+sqlite_pragmas = {
+    # readers no longer wait for writers, and writes only append to the log
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", default="WAL"),
+    # with WAL, NORMAL only fsyncs at checkpoints and is still corruption safe
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", default="NORMAL"),
+    # milliseconds to wait on a locked database before raising
+    "busy_timeout": os.environ.get("SQLITE_BUSY_TIMEOUT", default="5000"),
+    # negative values are in KiB, so 64 MiB of page cache per connection
+    "cache_size": os.environ.get("SQLITE_CACHE_SIZE", default="-65536"),
+    "mmap_size": os.environ.get("SQLITE_MMAP_SIZE", default="268435456"),
+}
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def _sized_pool(url: str) -> dict:
+    parsed = make_url(url)
+    dialect = parsed.get_dialect()
+    pool_size = {"pool_size": database_pool_size, "max_overflow": database_max_overflow}
+    in_memory = parsed.database in (None, "", ":memory:") or parsed.query.get("mode") == "memory"
+    if dialect.is_async and parsed.get_backend_name() == "sqlite" and not in_memory:
+        # aiosqlite defaults to a NullPool: a new connection, thread and round
+        # of pragmas for every checkout
+        return {"poolclass": AsyncAdaptedQueuePool, **pool_size}
+    if issubclass(dialect.get_pool_class(parsed), QueuePool):
+        return pool_size
+    # in-memory sqlite keeps its singleton or static pool
+    return {}
+
+def build_engine(url: str = database_url, create=create_engine, **kwargs) -> Engine:
+    """
+    Create a database engine configured from the environment.
+
+    :param url: database url, DATABASE_URL by default
+    :param create: engine constructor, create_async_engine for async urls
+    :param kwargs: overrides passed on to the constructor, e.g. poolclass
+    :return: the new engine
+    """
+    kwargs.setdefault("echo", database_echo)
+    is_sqlite = url.startswith("sqlite")
+    if is_sqlite:
+        kwargs.setdefault("connect_args", {"check_same_thread": False})
+    if "poolclass" not in kwargs:
+        for name, value in _sized_pool(url).items():
+            kwargs.setdefault(name, value)
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+    engine = create(url, **kwargs)
+    query_stats.instrument(engine)
+    if is_sqlite:
+        event.listen(getattr(engine, "sync_engine", engine), "connect", _set_sqlite_pragmas)
+    return engine
+
+engine = build_engine()
+
+def create_db_and_tables(bind: Engine = engine):
+    migrations.migrate(bind)
 
 def get_session():
     with Session(engine) as session:
@@ -49,6 +129,246 @@ class NoPermissionException(HTTPException):
             },
         )
 
+class InvalidCursorException(HTTPException):
+    def __init__(self, cursor: str):
+        super().__init__(
+            status_code=422,
+            detail={
+                "type": "invalid_cursor",
+                "cursor": cursor,
+            },
+        )
+
+class BatchTooLargeException(HTTPException):
+    def __init__(self, size: int, limit: int):
+        super().__init__(
+            status_code=422,
+            detail={
+                "type": "batch_too_large",
+                "size": size,
+                "limit": limit,
+            },
+        )
+
+class ResyncRequiredException(HTTPException):
+    def __init__(self, watermark: str):
+        super().__init__(
+            status_code=410,
+            detail={
+                "type": "resync_required",
+                "watermark": watermark,
+            },
+        )
+
+@dataclass
+class MessagePage:
+    """A page of chat messages plus the cursors of its neighbouring pages."""
+    messages: list[MessageInDB] = field(default_factory=list)
+    next: Optional[str] = None
+    prev: Optional[str] = None
+
+@dataclass
+class ChatPage:
+    """A page of chats plus the cursor of the next page."""
+    chats: list[ChatInDB] = field(default_factory=list)
+    next: Optional[str] = None
+
+@dataclass
+class MessageChanges:
+    """Message changes in a users chats, up to a watermark."""
+    watermark: str
+    has_more: bool = False
+    messages: list[MessageInDB] = field(default_factory=list)
+    deleted: list[MessageChangeInDB] = field(default_factory=list)
+
+def encode_message_cursor(message: MessageInDB) -> str:
+    """
+    Build an opaque cursor pointing at a message.
+
+    :param message: the message the cursor points at
+    :return: url safe cursor string
+    """
+    return encode_message_key(message.created_at, message.id)
+
+def encode_message_key(created_at: datetime, message_id: int) -> str:
+    """Build the cursor of encode_message_cursor from a message's (created_at, id) key."""
+    raw = f"{created_at.isoformat()}|{message_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_message_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decode a cursor built by encode_message_cursor.
+
+    :param cursor: the cursor string
+    :return: the (created_at, id) key of the message it points at
+    :raises InvalidCursorException: if the cursor is malformed
+    """
+    try:
+        created_at, message_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorException(cursor)
+
+def encode_chat_cursor(chat: ChatInDB) -> str:
+    """
+    Build an opaque cursor pointing at a chat in the recent activity order.
+
+    :param chat: the chat the cursor points at
+    :return: url safe cursor string
+    """
+    last_message_at = chat.last_message_at.isoformat() if chat.last_message_at else ""
+    raw = f"{last_message_at}|{chat.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_chat_cursor(cursor: str) -> tuple[Optional[datetime], int]:
+    """
+    Decode a cursor built by encode_chat_cursor.
+
+    :param cursor: the cursor string
+    :return: the (last_message_at, id) key of the chat it points at
+    :raises InvalidCursorException: if the cursor is malformed
+    """
+    try:
+        last_message_at, chat_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+        return (datetime.fromisoformat(last_message_at) if last_message_at else None,
+                int(chat_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorException(cursor)
+
+def _publish_message_event(event_type: str, message: Union[MessageInDB, Message]):
+    events.hub.publish(message.chat_id, {
+        "type": event_type,
+        "message": Message.model_validate(message).model_dump(mode="json"),
+    })
+
+# full-text index maintained by the triggers created in backend.migrations
+messages_fts = table("messages_fts", column("rowid"), column("rank"))
+
+def _fts_query(query: str) -> str:
+    # quote every term so user input is never parsed as FTS5 query syntax
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+@event.listens_for(Session, "after_flush")
+def _maintain_chat_counters(session: Session, _flush_context):
+    """
+    Keep the denormalized chat columns in step with a flush, in the same
+    transaction: message_count, user_count and last_message_at follow the
+    messages and memberships written, and version is bumped whenever
+    anything a chat's responses are built from changes. Rows written
+    without the ORM are fixed up by reconcile_chat_counters.
+    """
+    message_deltas = defaultdict(int)
+    user_deltas = defaultdict(int)
+    newest = {}
+    changed_chats = set()
+    changed_users = set()
+    for obj in session.new:
+        if isinstance(obj, MessageInDB):
+            message_deltas[obj.chat_id] += 1
+            key = (obj.created_at, obj.id)
+            if obj.chat_id not in newest or key > newest[obj.chat_id]:
+                newest[obj.chat_id] = key
+        elif isinstance(obj, UserChatLinkInDB):
+            user_deltas[obj.chat_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, MessageInDB):
+            message_deltas[obj.chat_id] -= 1
+        elif isinstance(obj, UserChatLinkInDB):
+            user_deltas[obj.chat_id] -= 1
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, MessageInDB):
+            changed_chats.add(obj.chat_id)
+        elif isinstance(obj, ChatInDB):
+            changed_chats.add(obj.id)
+        elif isinstance(obj, UserInDB):
+            changed_users.add(obj.id)
+    changed_chats |= message_deltas.keys() | user_deltas.keys()
+
+    chats = ChatInDB.__table__
+    connection = session.connection()
+    for chat_id in changed_chats:
+        values = {
+            "message_count": chats.c.message_count + message_deltas[chat_id],
+            "user_count": chats.c.user_count + user_deltas[chat_id],
+            "version": chats.c.version + 1,
+        }
+        if chat_id in newest:
+            # both read the old last_message_at, so they stay consistent
+            created_at, message_id = newest[chat_id]
+            is_older = chats.c.last_message_at > created_at
+            values["last_message_at"] = case(
+                (is_older, chats.c.last_message_at), else_=created_at,
+            )
+            values["last_message_id"] = case(
+                (is_older, chats.c.last_message_id), else_=message_id,
+            )
+        elif message_deltas[chat_id] < 0:
+            # the latest message may be the one deleted, look it up again
+            # (an index seek on messages(chat_id, created_at, id))
+            latest = _latest_message(MessageInDB.__table__.c.chat_id == chat_id)
+            values["last_message_at"] = latest.with_only_columns(
+                MessageInDB.__table__.c.created_at
+            ).scalar_subquery()
+            values["last_message_id"] = latest.scalar_subquery()
+        connection.execute(update(chats).where(chats.c.id == chat_id).values(**values))
+
+    if changed_users:
+        # user profiles are embedded in chat and message responses
+        links = UserChatLinkInDB.__table__
+        member_chats = select(links.c.chat_id).where(links.c.user_id.in_(changed_users))
+        connection.execute(
+            update(chats)
+            .where(chats.c.id.in_(member_chats) | chats.c.owner_id.in_(changed_users))
+            .values(version=chats.c.version + 1)
+        )
+
+    if not changed_chats and not changed_users:
+        return
+    for chat in list(session.identity_map.values()):
+        if isinstance(chat, ChatInDB):
+            session.expire(chat, ["message_count", "user_count", "last_message_at",
+                                  "last_message_id", "version"])
+
+def _latest_message(where):
+    messages = MessageInDB.__table__
+    return (
+        select(messages.c.id)
+        .where(where)
+        .order_by(messages.c.created_at.desc(), messages.c.id.desc())
+        .limit(1)
+    )
+
+def _record_message_change(session: Session, message: MessageInDB, kind: str):
+    # written in the same transaction as the change itself
+    session.add(MessageChangeInDB(
+        chat_id=message.chat_id,
+        message_id=message.id,
+        kind=kind,
+    ))
+
+def encode_watermark(change_id: int) -> str:
+    return base64.urlsafe_b64encode(f"changes:{change_id}".encode()).decode()
+
+def decode_watermark(watermark: str) -> int:
+    """
+    Decode a watermark built by encode_watermark.
+
+    :raises InvalidCursorException: if the watermark is malformed
+    """
+    try:
+        prefix, change_id = base64.urlsafe_b64decode(watermark.encode()).decode().split(":")
+        if prefix != "changes":
+            raise ValueError(prefix)
+        return int(change_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursorException(watermark)
+
 #   -------- Users --------   #
 
 def get_all_users(session: Session) -> list[UserInDB]:
@@ -94,6 +414,7 @@ def update_user(session: Session, user_id: int, user_update: UserUpdate) -> User
     session.add(user)
     session.commit()
     session.refresh(user)
+    principal_cache.invalidate_user(user.id)
 
     return user
 
@@ -110,16 +431,26 @@ def get_user_by_id(session: Session, user_id: int) -> UserInDB:
     
     raise EntityNotFoundException(entity_name="User", entity_id=user_id)
 
-def get_users_chats(session: Session, user_id: int) -> list[ChatInDB]:
+def get_users_chats(session: Session, user_id: int,
+                    limit: Optional[int] = None, offset: int = 0) -> list[ChatInDB]:
     """
     Retrieve a users chats from the database.
 
     :param user_id: id of the user
-    :return: ordered list of chats
+    :param limit: maximum number of chats to return, all if None
+    :param offset: number of chats to skip
+    :return: list of chats ordered by name
     """
-    user = get_user_by_id(session, user_id)
-    chats = get_all_chats(session, user_id)
-    return [chat for chat in chats if user in chat.users]
+    get_user_by_id(session, user_id)
+    return session.exec(
+        select(ChatInDB)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.user_id == user_id)
+        .options(joinedload(ChatInDB.owner))
+        .order_by(ChatInDB.name, ChatInDB.id)
+        .offset(offset)
+        .limit(limit)
+    ).all()
 
 
 #   -------- Chats --------   #
@@ -131,23 +462,121 @@ def get_all_chats(session: Session, user_id: int) -> list[ChatInDB]:
 
     :return: ordered list of chats
     """
-    return session.exec(select(ChatInDB).join(UserChatLinkInDB).where(UserChatLinkInDB.user_id == user_id)).all()
+    return session.exec(
+        select(ChatInDB)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.user_id == user_id)
+        .options(joinedload(ChatInDB.owner))
+    ).all()
+
+def get_recent_chats(session: Session, user_id: int, after: Optional[str] = None,
+                     limit: int = 50) -> ChatPage:
+    """
+    Retrieve a page of a users chats, most recently active first.
+
+    Chats are ordered by (last_message_at, id) descending, with chats
+    without messages last, and paged with keyset cursors. Each chat comes
+    with its owner and its last message, all in one query.
+
+    :param user_id: id of the user
+    :param after: only return chats after this cursor
+    :param limit: maximum number of chats to return
+    :return: page of chats with the cursor of the next page
+    """
+    query = (
+        select(ChatInDB)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.user_id == user_id)
+        .options(joinedload(ChatInDB.owner), joinedload(ChatInDB.last_message))
+        # sqlite sorts NULLs first, so chats without messages come last
+        .order_by(ChatInDB.last_message_at.desc(), ChatInDB.id.desc())
+        .limit(limit + 1)
+    )
+    if after is not None:
+        last_message_at, chat_id = decode_chat_cursor(after)
+        if last_message_at is None:
+            query = query.where(ChatInDB.last_message_at.is_(None), ChatInDB.id < chat_id)
+        else:
+            query = query.where(
+                (tuple_(ChatInDB.last_message_at, ChatInDB.id) < (last_message_at, chat_id))
+                | ChatInDB.last_message_at.is_(None)
+            )
+
+    chats = list(session.exec(query).unique().all())
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    return ChatPage(
+        chats=chats,
+        next=encode_chat_cursor(chats[-1]) if has_more else None,
+    )
+
+def is_chat_member(session: Session, chat_id: int, user_id: int) -> bool:
+    """
+    Check whether a user belongs to a chat.
+
+    A primary key lookup on user_chat_links, so the cost does not depend on
+    the size of the chat. Positive answers are memoized on the session,
+    which lives for a single request.
+
+    :param chat_id: id of the chat
+    :param user_id: id of the user
+    :return: whether the user is a member of the chat
+    """
+    members = session.info.setdefault("chat_members", set())
+    if (chat_id, user_id) in members:
+        return True
+
+    link = session.exec(
+        select(UserChatLinkInDB.user_id).where(
+            UserChatLinkInDB.user_id == user_id,
+            UserChatLinkInDB.chat_id == chat_id,
+        )
+    ).first()
+    if link is None:
+        return False
+
+    members.add((chat_id, user_id))
+    return True
+
+def get_chat_version(session: Session, chat_id: int, user_id: int) -> int:
+    """
+    Retrieve the version of a chat, which changes whenever the chat, its
+    messages, its members or their profiles change.
+
+    :param chat_id: id of the chat
+    :param user_id: id of the user, who must be a member of the chat
+    :return: the current version
+    """
+    return get_chat_by_id(session, chat_id, user_id).version
+
+def get_chat_versions(session: Session, user_id: int) -> list[tuple[int, int]]:
+    """
+    Retrieve the versions of all of a users chats.
+
+    :param user_id: id of the user
+    :return: (chat id, version) pairs ordered by chat id
+    """
+    return session.exec(
+        select(ChatInDB.id, ChatInDB.version)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.user_id == user_id)
+        .order_by(ChatInDB.id)
+    ).all()
 
 def get_chat_by_id(session: Session, chat_id: int, user_id: int) -> ChatInDB:
     """
     Retrieve a chat from the database.
 
     :param chat_id: id of the chat to be retrieved
+    :param user_id: id of the user, who must be a member of the chat
     :return: the retrieved chat
     """
-    chat = session.get(ChatInDB, chat_id)
+    # routes pass the raw path segment; an int key lets repeated lookups
+    # within a request hit the session's identity map
+    key = int(chat_id) if isinstance(chat_id, str) and chat_id.isdigit() else chat_id
+    chat = session.get(ChatInDB, key, options=[joinedload(ChatInDB.owner)])
     if chat:
-        containsUser = False
-        for user in chat.users:
-            if user.id == user_id:
-                containsUser = True
-                break
-        if not containsUser:
+        if not is_chat_member(session, chat.id, user_id):
             raise NoPermissionException(action="view", entity="chat")
         return chat
 
@@ -183,17 +612,107 @@ def delete_chat(session: Session, chat_id: int, user_id: int):
     session.delete(chat)
     session.commit()
 
-def get_chat_messages(session: Session, chat_id: int, user_id: int) -> list[MessageInDB]:
+def get_chat_messages(session: Session, chat_id: int, user_id: int,
+                      before: Optional[str] = None, after: Optional[str] = None,
+                      limit: Optional[int] = None) -> MessagePage:
     """
-    Retrieve a chats messages from the database.
+    Retrieve a page of a chats messages from the database.
+
+    Messages are ordered by (created_at, id) and paged with keyset cursors,
+    so the cost of a page does not depend on how long the chat history is.
+    With a limit but no cursor the most recent page is returned.
 
     :param chat_id: id of the chat
-    :return: ordered list of chat messages
+    :param before: only return messages before this cursor
+    :param after: only return messages after this cursor
+    :param limit: maximum number of messages to return, all if None
+    :return: ordered page of chat messages with next/prev cursors
     """
+    get_chat_by_id(session, chat_id, user_id)
 
-    chat = get_chat_by_id(session, chat_id, user_id)
+    key = tuple_(MessageInDB.created_at, MessageInDB.id)
+    query = (
+        select(MessageInDB)
+        .where(MessageInDB.chat_id == chat_id)
+        .options(joinedload(MessageInDB.user))
+    )
+    if before is not None:
+        query = query.where(key < decode_message_cursor(before))
+    if after is not None:
+        query = query.where(key > decode_message_cursor(after))
+
+    # walk backwards from the newest message unless paging forwards
+    forwards = after is not None or limit is None
+    if forwards:
+        query = query.order_by(MessageInDB.created_at, MessageInDB.id)
+    else:
+        query = query.order_by(MessageInDB.created_at.desc(), MessageInDB.id.desc())
+    if limit is not None:
+        query = query.limit(limit + 1)
+
+    messages = list(session.exec(query).all())
+    has_more = limit is not None and len(messages) > limit
+    messages = messages[:limit]
+    if forwards:
+        has_next, has_prev = has_more or before is not None, after is not None
+    else:
+        messages.reverse()
+        has_next, has_prev = before is not None, has_more
+
+    return MessagePage(
+        messages=messages,
+        next=encode_message_cursor(messages[-1]) if messages and has_next else None,
+        prev=encode_message_cursor(messages[0]) if messages and has_prev else None,
+    )
+
+def iter_chat_messages(session: Session, chat_id: int,
+                       after: Optional[tuple[datetime, int]] = None,
+                       batch_size: int = 1000) -> Iterator[list[dict]]:
+    """
+    Stream all messages of a chat, oldest first, in batches.
+
+    Rows are read from a server-side cursor and projected straight onto the
+    Message response shape, so memory use depends on batch_size only and
+    not on the size of the chat. Access is not checked here, callers check
+    it before they start streaming.
 
-    return chat.messages
+    :param chat_id: id of the chat
+    :param after: only messages after this (created_at, id) key
+    :param batch_size: rows per fetch and per yielded batch
+    :return: iterator of batches of message dicts
+    """
+    query = (
+        select(
+            MessageInDB.id, MessageInDB.text, MessageInDB.chat_id,
+            MessageInDB.created_at, UserInDB.id.label("user_id"), UserInDB.username,
+            UserInDB.email, UserInDB.created_at.label("user_created_at"),
+        )
+        .join(UserInDB, UserInDB.id == MessageInDB.user_id)
+        .where(MessageInDB.chat_id == chat_id)
+        .order_by(MessageInDB.created_at, MessageInDB.id)
+    )
+    if after is not None:
+        query = query.where(tuple_(MessageInDB.created_at, MessageInDB.id) > after)
+
+    result = session.connection().execution_options(
+        stream_results=True, yield_per=batch_size,
+    ).execute(query)
+    for rows in result.partitions():
+        yield [
+            {
+                "id": row.id,
+                "text": row.text,
+                "chat_id": row.chat_id,
+                "user": {
+                    "id": row.user_id,
+                    "username": row.username,
+                    "email": row.email,
+                    "created_at": row.user_created_at,
+                },
+                "created_at": row.created_at,
+            }
+            for row in rows
+        ]
 
 def get_chat_message_by_id(session: Session, chat_id: int, 
                            message_id: int, user_id: int) -> MessageInDB:
@@ -204,10 +723,18 @@ def get_chat_message_by_id(session: Session, chat_id: int,
     :param message_id: id of the message
     :return: the chat message
     """
-    messages = get_chat_messages(session, chat_id, user_id)
-    for message in messages:
-        if message.id == message_id:
-            return message
+    get_chat_by_id(session, chat_id, user_id)
+    message = session.exec(
+        select(MessageInDB)
+        .where(
+            MessageInDB.id == message_id,
+            MessageInDB.chat_id == chat_id,
+        )
+        .options(joinedload(MessageInDB.user))
+    ).first()
+    if message:
+        return message
+
     raise EntityNotFoundException(entity_name="Message", entity_id=message_id)
 
 def update_message(session: Session, chat_id: int, 
@@ -223,15 +750,17 @@ def update_message(session: Session, chat_id: int,
     :return: the updated message
     """
     message = get_chat_message_by_id(session, chat_id, message_id, user_id)
-    if message.user.id != user_id:
+    if message.user_id != user_id:
         raise NoPermissionException(action="edit", entity="message")
 
     for attr, value, in message_update.model_dump(exclude_none=True).items():
         setattr(message, attr, value)
     
     session.add(message)
+    _record_message_change(session, message, "updated")
     session.commit()
     session.refresh(message)
+    _publish_message_event("message_updated", message)
 
     return message
 
@@ -245,22 +774,75 @@ def delete_message(session: Session, chat_id: int,
     :param user_id: the id of the current user
     """
     message = get_chat_message_by_id(session, chat_id, message_id, user_id)
-    if message.user.id != user_id:
+    if message.user_id != user_id:
         raise NoPermissionException(action="edit", entity="message")
+    event = {
+        "type": "message_deleted",
+        "chat_id": message.chat_id,
+        "message_id": message.id,
+    }
+    _record_message_change(session, message, "deleted")
     session.delete(message)
     session.commit()
+    events.hub.publish(event["chat_id"], event)
+
+
+def search_messages(session: Session, user_id: int, query: str,
+                    chat_id: Optional[int] = None,
+                    limit: int = 20, offset: int = 0) -> list[MessageInDB]:
+    """
+    Full-text search of the messages in a users chats.
+
+    :param user_id: id of the user, only chats they belong to are searched
+    :param query: words that must all appear in the message
+    :param chat_id: only search this chat, if given
+    :param limit: maximum number of messages to return
+    :param offset: number of messages to skip
+    :return: matching messages, best match first
+    """
+    if chat_id is not None:
+        chat_id = get_chat_by_id(session, chat_id, user_id).id
+    match = _fts_query(query)
+    if not match:
+        return []
+
+    statement = (
+        select(MessageInDB)
+        .join(messages_fts, messages_fts.c.rowid == MessageInDB.id)
+        .join(UserChatLinkInDB, and_(
+            UserChatLinkInDB.chat_id == MessageInDB.chat_id,
+            UserChatLinkInDB.user_id == user_id,
+        ))
+        .where(text("messages_fts MATCH :match").bindparams(match=match))
+        .options(joinedload(MessageInDB.user))
+        .order_by(messages_fts.c.rank, MessageInDB.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    if chat_id is not None:
+        statement = statement.where(MessageInDB.chat_id == chat_id)
 
+    return session.exec(statement).all()
 
-def get_chat_users(session: Session, chat_id: int, user_id: int) -> list[UserInDB]:
+def get_chat_users(session: Session, chat_id: int, user_id: int,
+                   limit: Optional[int] = None, offset: int = 0) -> list[UserInDB]:
     """
     Retrieve a chats users from the database.
 
     :param chat_id: id of the chat
-    :return: ordered list of chat users
+    :param limit: maximum number of users to return, all if None
+    :param offset: number of users to skip
+    :return: list of chat users ordered by id
     """
     chat = get_chat_by_id(session, chat_id, user_id)
-    all_users = get_all_users(session)
-    return [user for user in all_users if chat.users.__contains__(user)]
+    return session.exec(
+        select(UserInDB)
+        .join(UserChatLinkInDB)
+        .where(UserChatLinkInDB.chat_id == chat.id)
+        .order_by(UserInDB.id)
+        .offset(offset)
+        .limit(limit)
+    ).all()
 
 def create_message(session: Session, chat_id: int, user_id: int, text: str) -> MessageInDB:
     """
@@ -271,16 +853,163 @@ def create_message(session: Session, chat_id: int, user_id: int, text: str) -> M
     :param text: the text for the message
     :return: the newly added message
     """
+    return _insert_messages(session, chat_id, user_id, [text])[0]
+
+def create_messages(session: Session, chat_id: int, user_id: int,
+                    texts: list[str]) -> list[MessageInDB]:
+    """
+    Adds several messages for the current user in the given chat, all or none.
+
+    :param chat_id: id of the chat
+    :param user_id: id of the user
+    :param texts: the texts of the messages, in order
+    :return: the newly added messages, in order
+    :raises BatchTooLargeException: if there are more than message_batch_max texts
+    """
+    if len(texts) > message_batch_max:
+        raise BatchTooLargeException(len(texts), message_batch_max)
+    return _insert_messages(session, chat_id, user_id, texts)
+
+def _insert_messages(session: Session, chat_id: int, user_id: int,
+                     texts: list[str]) -> list[MessageInDB]:
+    # one membership check, one flush and one commit however many messages
+    # there are
     get_chat_by_id(session, chat_id, user_id)
 
-    message = MessageInDB(
-        text = text,
-        user_id = user_id,
-        chat_id = chat_id,
+    message_ids = stage_messages(session, [
+        MessageInDB(text=text, user_id=user_id, chat_id=chat_id)
+        for text in texts
+    ])
+    session.commit()
+
+    messages = load_messages(session, message_ids)
+    for message in messages:
+        publish_message_created(message)
+
+    return messages
+
+def stage_messages(session: Session, messages: list[MessageInDB]) -> list[int]:
+    """
+    Insert new messages and their change log entries without committing.
+    Access must already have been checked.
+
+    :param messages: the new messages, of any chats and users
+    :return: the ids of the messages, in order
+    """
+    # sqlite cannot return the ids of a multi-row INSERT in order, so the
+    # messages are still inserted one statement each, but the change log,
+    # which needs no ids back, is a single executemany
+    session.add_all(messages)
+    session.flush()
+    message_ids = [message.id for message in messages]
+    changed_at = datetime.now()
+    session.execute(insert(MessageChangeInDB), [
+        {"chat_id": message.chat_id, "message_id": message.id, "kind": "created",
+         "changed_at": changed_at}
+        for message in messages
+    ])
+    return message_ids
+
+def load_messages(session: Session, message_ids: list[int]) -> list[MessageInDB]:
+    """
+    Load messages with their users in one query.
+
+    :param message_ids: ids of the messages
+    :return: the messages, in the order of message_ids
+    """
+    loaded = {
+        message.id: message
+        for message in session.exec(
+            select(MessageInDB)
+            .where(MessageInDB.id.in_(message_ids))
+            .options(joinedload(MessageInDB.user))
+        )
+    }
+    return [loaded[message_id] for message_id in message_ids]
+
+def publish_message_created(message: Union[MessageInDB, Message]):
+    """Notify the chat's websocket subscribers of a new message."""
+    _publish_message_event("message_created", message)
+
+def get_message_changes(session: Session, user_id: int, since: Optional[str],
+                        limit: int = 500) -> MessageChanges:
+    """
+    Retrieve what changed in a users chats since a watermark.
+
+    Several changes to the same message collapse into its latest state. Without
+    a watermark nothing is returned but the current one, to start syncing from.
+
+    :param user_id: id of the user
+    :param since: watermark returned by a previous call, or None
+    :param limit: maximum number of changes to read in one call
+    :return: the changes and the watermark to continue from
+    """
+    if since is None:
+        latest = session.exec(select(func.max(MessageChangeInDB.id))).one()
+        return MessageChanges(watermark=encode_watermark(latest or 0))
+
+    after = decode_watermark(since)
+    oldest = session.exec(select(func.min(MessageChangeInDB.id))).one()
+    if oldest is not None and after < oldest - 1:
+        # changes after the watermark have been pruned
+        raise ResyncRequiredException(since)
+
+    changes = session.exec(
+        select(MessageChangeInDB)
+        .join(UserChatLinkInDB, and_(
+            UserChatLinkInDB.chat_id == MessageChangeInDB.chat_id,
+            UserChatLinkInDB.user_id == user_id,
+        ))
+        .where(MessageChangeInDB.id > after)
+        .order_by(MessageChangeInDB.id)
+        .limit(limit + 1)
+    ).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return MessageChanges(watermark=since)
+
+    latest = {change.message_id: change for change in changes}
+    deleted = [change for change in latest.values() if change.kind == "deleted"]
+    changed_ids = [id for id, change in latest.items() if change.kind != "deleted"]
+    # a message deleted after this page is simply missing here, its
+    # deletion comes with the next page
+    messages = session.exec(
+        select(MessageInDB)
+        .where(MessageInDB.id.in_(changed_ids))
+        .options(joinedload(MessageInDB.user))
+        .order_by(MessageInDB.id)
+    ).all() if changed_ids else []
+
+    return MessageChanges(
+        watermark=encode_watermark(changes[-1].id),
+        has_more=has_more,
+        messages=messages,
+        deleted=deleted,
     )
 
-    session.add(message)
-    session.commit()
-    session.refresh(message)
+def prune_message_changes(session: Session, older_than: Optional[datetime] = None) -> int:
+    """
+    Delete message changes older than the retention period. /sync answers
+    watermarks from before the oldest remaining change with a 410, and those
+    clients start over with a full sync.
 
-    return message
\ No newline at end of file
+    :param older_than: cutoff, message_change_retention_days ago by default
+    :return: the number of changes deleted
+    """
+    if older_than is None:
+        older_than = datetime.now() - timedelta(days=message_change_retention_days)
+    # only ever a prefix of the log, so the oldest remaining id tells how far
+    # it was pruned, and the latest change is always kept for the same reason
+    latest, boundary = session.exec(select(
+        func.max(MessageChangeInDB.id),
+        func.max(MessageChangeInDB.id).filter(MessageChangeInDB.changed_at < older_than),
+    )).one()
+    if boundary is None:
+        return 0
+    result = session.execute(
+        delete(MessageChangeInDB)
+        .where(MessageChangeInDB.id <= min(boundary, latest - 1))
+    )
+    session.commit()
+    return result.rowcount
@@ -1,12 +1,17 @@
 from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 class UserChatLinkInDB(SQLModel, table=True):
     """Database model for many-to-many relation of users to chats."""
 
     __tablename__ = "user_chat_links"
+    # the primary key leads with user_id, this serves lookups by chat
+    __table_args__ = (
+        Index("ix_user_chat_links_chat_id_user_id", "chat_id", "user_id"),
+    )
 
     user_id: int = Field(foreign_key="users.id", primary_key=True)
     chat_id: int = Field(foreign_key="chats.id", primary_key=True)
@@ -51,13 +56,32 @@ class ChatInDB(SQLModel, table=True):
     """Database model for chat."""
 
     __tablename__ = "chats"
+    # the inbox order of /chats?order=recent
+    __table_args__ = (
+        Index("ix_chats_last_message_at_id", "last_message_at", "id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
     owner_id: int = Field(foreign_key="users.id")
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
 
+    # denormalized, maintained on flush by backend.database
+    message_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    user_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+    last_message_at: Optional[datetime] = None
+    # no foreign key, messages already reference chats
+    last_message_id: Optional[int] = None
+    # bumped on every change to the chat, its messages or its members
+    version: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
+
     owner: UserInDB = Relationship()
+    last_message: Optional["MessageInDB"] = Relationship(
+        sa_relationship_kwargs={
+            "primaryjoin": "foreign(ChatInDB.last_message_id) == MessageInDB.id",
+            "viewonly": True,
+        },
+    )
     users: list[UserInDB] = Relationship(
         back_populates="chats",
         link_model=UserChatLinkInDB,
@@ -68,6 +92,10 @@ class MessageInDB(SQLModel, table=True):
     """Database model for message."""
 
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_chat_id_created_at_id", "chat_id", "created_at", "id"),
+        Index("ix_messages_user_id", "user_id"),
+    )
 
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
@@ -78,6 +106,22 @@ class MessageInDB(SQLModel, table=True):
     user: UserInDB = Relationship()
     chat: ChatInDB = Relationship(back_populates="messages")
 
+class MessageChangeInDB(SQLModel, table=True):
+    """Database model for the log of message changes, read by /sync."""
+
+    __tablename__ = "message_changes"
+    __table_args__ = (
+        Index("ix_message_changes_chat_id_id", "chat_id", "id"),
+        # ids are the sync watermark, so they must never be reused
+        {"sqlite_autoincrement": True},
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(foreign_key="chats.id")
+    message_id: int
+    kind: str  # "created", "updated" or "deleted"
+    changed_at: Optional[datetime] = Field(default_factory=datetime.now)
+
 class ChatUpdate(BaseModel):
     """Represents parameters for updating a chat in the system."""
     name: str = None
@@ -89,6 +133,17 @@ class Chat(SQLModel):
     owner: User
     created_at: datetime
 
+class MessagePreview(SQLModel):
+    """Represents the latest message of a chat, as shown in a chat list."""
+    id: int
+    text: str
+    user_id: int
+    created_at: datetime
+
+class ChatSummary(Chat):
+    """Represents a chat in a chat list, with its latest message."""
+    last_message: Optional[MessagePreview] = None
+
 class Message(SQLModel):
     """Represents a message."""
     id: int
@@ -101,6 +156,10 @@ class MessageCreate(SQLModel):
     """Represents a message with just the text."""
     text: str
 
+class MessageBatchCreate(BaseModel):
+    """Represents several messages to add at once."""
+    messages: list[MessageCreate] = Field(min_length=1)
+
 class MessageResponse(BaseModel):
     """Represents a response for a message."""
     message: Message
@@ -113,6 +172,7 @@ class ChatMetadata(BaseModel):
     """Represents metadata for a chat."""
     message_count: int
     user_count: int
+    last_message_at: Optional[datetime] = None
 
 class ChatResponse(BaseModel):
     """Represents a response for a chat."""
@@ -129,6 +189,11 @@ class Metadata(BaseModel):
     """Represents metadata for a collection."""
     count: int
 
+class PageMetadata(Metadata):
+    """Represents metadata for a page of a cursor paginated collection."""
+    next: Optional[str] = None
+    prev: Optional[str] = None
+
 class UserCollection(BaseModel):
     """Represents an API response for a collection of users."""
     meta: Metadata
@@ -139,7 +204,24 @@ class ChatCollection(BaseModel):
     meta: Metadata
     chats: list[Chat]
 
+class ChatSummaryCollection(BaseModel):
+    """Represents an API response for a page of chats with their latest messages."""
+    meta: PageMetadata
+    chats: list[ChatSummary]
+
 class MessageCollection(BaseModel):
     """Represents an API response for a collection of messages."""
-    meta: Metadata
-    messages: list[Message]
\ No newline at end of file
+    meta: PageMetadata
+    messages: list[Message]
+
+class DeletedMessage(BaseModel):
+    """Represents a message that has been deleted."""
+    id: int
+    chat_id: int
+
+class SyncResponse(BaseModel):
+    """Represents the message changes in a users chats since a watermark."""
+    watermark: str
+    has_more: bool
+    messages: list[Message]
+    deleted: list[DeletedMessage]
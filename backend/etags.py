@@ -0,0 +1,32 @@
+import hashlib
+
+from fastapi import Request, Response
+
+# Weak validators: the same representation may be sent gzipped or not, and
+# only the underlying chat data matters for whether it changed.
+
+def make_etag(*parts) -> str:
+    """
+    Build a weak ETag from the values a response is derived from.
+
+    :param parts: anything with a stable str(), e.g. versions and query strings
+    :return: the quoted ETag header value
+    """
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    # cache, but revalidate with If-None-Match before every use
+    response.headers["Cache-Control"] = "no-cache"
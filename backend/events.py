@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+from typing import Optional
+
+# the hub is in-process: when running several uvicorn workers, a client only
+# sees the changes committed by the worker it is connected to
+
+max_queued_events = int(os.environ.get("WS_MAX_QUEUED_EVENTS", default=100))
+
+class Subscription:
+    """A single websocket's bounded queue of events for one chat."""
+
+    def __init__(self, chat_id: int, maxsize: int):
+        self.chat_id = chat_id
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue[Optional[dict]] = asyncio.Queue(maxsize=maxsize)
+
+    async def get(self) -> Optional[dict]:
+        """
+        Wait for the next event.
+
+        :return: the event, or None once the subscription is closed
+        """
+        return await self._queue.get()
+
+    def close(self):
+        """Wake the consumer with the end-of-stream marker (loop thread only)."""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    def _offer(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a consumer that cannot keep up is dropped instead of buffering
+            # without bound; it can reconnect and re-fetch the messages
+            self.overflowed = True
+            self.close()
+
+class EventHub:
+    """In-process fan-out of chat events to websocket subscribers."""
+
+    def __init__(self, maxsize: int = max_queued_events):
+        self.maxsize = maxsize
+        self._subscriptions: dict[int, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, chat_id: int) -> Subscription:
+        """
+        Subscribe to the events of a chat (must be called on the event loop).
+
+        :param chat_id: id of the chat
+        :return: the new subscription
+        """
+        subscription = Subscription(int(chat_id), self.maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(subscription.chat_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.chat_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.chat_id, None)
+
+    def publish(self, chat_id: int, event: dict):
+        """
+        Queue an event for every subscriber of a chat. Safe to call from any
+        thread, including the request thread pool.
+
+        :param chat_id: id of the chat
+        :param event: json serializable event
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(int(chat_id), ()))
+        for subscription in subscriptions:
+            try:
+                subscription._loop.call_soon_threadsafe(subscription._offer, event)
+            except RuntimeError:
+                # the subscriber's event loop has already shut down
+                self.unsubscribe(subscription)
+
+hub = EventHub()
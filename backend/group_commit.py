@@ -0,0 +1,179 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import Engine
+from sqlmodel import Session
+
+from backend import database as db
+from backend import query_stats
+from backend.entities import Message, MessageInDB
+
+# Opt-in group commit for new messages. Every create_message commits on its
+# own, and every commit is an fsync taken under sqlite's single writer lock,
+# which caps posts per second at the fsync rate however many requests are
+# waiting. With GROUP_COMMIT=1 new messages are handed to one writer thread
+# instead, which inserts everything that arrives within window seconds (up
+# to max_batch messages) in one transaction, so the cost of a commit is
+# shared by all of them. Each caller still gets its own message or error.
+
+enabled = os.environ.get("GROUP_COMMIT", default="0") == "1"
+group_commit_window = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", default=2)) / 1000
+group_commit_max_batch = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", default=128))
+
+logger = logging.getLogger("backend.group_commit")
+
+@dataclass
+class _Request:
+    chat_id: int
+    user_id: int
+    text: str
+    future: Future = field(default_factory=Future)
+    # the submitting request's query accounting, the writer thread has its own
+    stats: Optional[query_stats.RequestQueryStats] = field(default_factory=query_stats.current)
+
+_stop = object()
+
+class GroupCommitWriter:
+    def __init__(self, engine: Engine, window: float = group_commit_window,
+                 max_batch: int = group_commit_max_batch):
+        self.engine = engine
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, chat_id: int, user_id: int, text: str) -> Future:
+        """
+        Queue a new message for the next group commit.
+
+        :return: future of the created message, or of the error creating it
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True,
+                )
+                self._thread.start()
+        request = _Request(chat_id, user_id, text)
+        self._queue.put(request)
+        return request.future
+
+    def create_message(self, chat_id: int, user_id: int, text: str) -> Message:
+        """
+        Add a new message through the group commit, blocking until it is committed.
+
+        :return: the newly added message
+        """
+        return self.submit(chat_id, user_id, text).result()
+
+    def close(self):
+        """Commit what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_stop)
+            thread.join()
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is _stop:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.window
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is _stop:
+                    stopping = True
+                    break
+                batch.append(request)
+
+            stats = query_stats.start({"path": "group commit"})
+            outcomes: dict[int, tuple] = {}
+            try:
+                self._write(batch, outcomes)
+            except Exception as error:
+                # e.g. the database went away, nobody may be left waiting
+                for request in batch:
+                    outcomes.setdefault(id(request), (None, error))
+            self._resolve(batch, outcomes, stats)
+            if stopping:
+                return
+
+    def _resolve(self, batch: list[_Request], outcomes: dict[int, tuple],
+                 stats: query_stats.RequestQueryStats):
+        # every caller is charged an equal share of the batch's queries, so
+        # the per-request counts still add up to what actually ran; this
+        # happens before the futures resolve and the requests report theirs
+        count, remainder = divmod(stats.count, len(batch))
+        for i, request in enumerate(batch):
+            if request.stats is not None:
+                request.stats.count += count + (i < remainder)
+                request.stats.duration += stats.duration / len(batch)
+        for request in batch:
+            result, error = outcomes[id(request)]
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+
+    def _write(self, batch: list[_Request], outcomes: dict[int, tuple]):
+        # outcomes collects (message, error) by id(request), resolved by _run
+        self.batches += 1
+        with Session(self.engine) as session:
+            # access is a read, so a failed check does not affect the others
+            accepted = []
+            for request in batch:
+                try:
+                    db.get_chat_by_id(session, request.chat_id, request.user_id)
+                except Exception as error:
+                    outcomes[id(request)] = (None, error)
+                else:
+                    accepted.append(request)
+            if not accepted:
+                return
+
+            try:
+                message_ids = db.stage_messages(session, [
+                    MessageInDB(text=request.text, user_id=request.user_id,
+                                chat_id=request.chat_id)
+                    for request in accepted
+                ])
+                # built before the commit, so that once it succeeds nothing
+                # is left that could fail a caller whose message was written
+                messages = [
+                    Message.model_validate(message)
+                    for message in db.load_messages(session, message_ids)
+                ]
+                session.commit()
+            except Exception as error:
+                session.rollback()
+                if len(accepted) == 1:
+                    outcomes[id(accepted[0])] = (None, error)
+                else:
+                    # find the culprit by committing each message on its own
+                    for request in accepted:
+                        self._write([request], outcomes)
+                return
+
+        for request, message in zip(accepted, messages):
+            outcomes[id(request)] = (message, None)
+        for message in messages:
+            try:
+                db.publish_message_created(message)
+            except Exception:
+                logger.exception("publishing new message %s failed", message.id)
+
+writer = GroupCommitWriter(db.engine) if enabled else None
@@ -2,12 +2,20 @@ from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse, HTMLResponse
 from backend.routers.user_routers import users_router
 from backend.routers.chat_routers import chats_router
+from backend.routers.async_chat_routers import async_chats_router
+from backend.routers.sync_routers import sync_router
+from backend.routers.metrics_routers import metrics_router
+from backend import async_database
 from backend.database import EntityNotFoundException
 from backend.database import DuplicateEntityException
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from backend.database import create_db_and_tables
 from backend.auth import auth_router
+from backend import passwords
+from backend import group_commit
+from backend.compression import CompressionMiddleware
+from backend.metrics import MetricsMiddleware
 
 # python -m uvicorn backend.main:app --reload
 
@@ -15,6 +23,9 @@ from backend.auth import auth_router
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     yield
+    if group_commit.writer is not None:
+        group_commit.writer.close()
+    passwords.shutdown()
 
 app = FastAPI(
     title="Pony Express API",
@@ -24,8 +35,13 @@ app = FastAPI(
 )
 
 app.include_router(users_router)
+if async_database.enabled:
+    # must come first so the migrated routes shadow their sync versions
+    app.include_router(async_chats_router)
 app.include_router(chats_router)
+app.include_router(sync_router)
 app.include_router(auth_router)
+app.include_router(metrics_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +50,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+# outermost, so the recorded latency includes the other middlewares
+app.add_middleware(MetricsMiddleware)
 
 # handle custom exceptions
 @app.exception_handler(EntityNotFoundException)
@@ -0,0 +1,102 @@
+import argparse
+from datetime import datetime, timedelta
+
+from sqlmodel import Session
+
+from backend import database as db
+from backend import migrations
+from backend import seed as bulk
+
+# python -m backend.manage migrate
+# python -m backend.manage prune-changes --days 30
+# python -m backend.manage seed --users 10000 --chats 1000 --messages 10000000 --defer-indexes
+# python -m backend.manage import dump.ndjson
+
+def migrate(engine, _args):
+    """Bring the database schema up to date with the models."""
+    migrations.migrate(engine)
+
+def rebuild_search(engine, _args):
+    """Rebuild the full-text index of all messages."""
+    with engine.begin() as connection:
+        migrations.rebuild_message_search(connection)
+
+def reconcile_counters(engine, _args):
+    """Recompute the message and user counters of every chat."""
+    with engine.begin() as connection:
+        migrations.reconcile_chat_counters(connection)
+
+def prune_changes(engine, args):
+    """Delete message changes older than the /sync retention period."""
+    with Session(engine) as session:
+        older_than = datetime.now() - timedelta(days=args.days)
+        print(f"deleted {db.prune_message_changes(session, older_than)} message changes")
+
+def seed(engine, args):
+    """Bulk load a generated dataset of users, chats and messages."""
+    migrations.migrate(engine)
+    records = bulk.generate(engine, args.users, args.chats, args.members,
+                            args.messages, password=args.password)
+    print(bulk.load(engine, records, batch_size=args.batch_size,
+                    defer_indexes=args.defer_indexes))
+
+def import_ndjson(engine, args):
+    """Bulk load users, chats, memberships and messages from NDJSON."""
+    migrations.migrate(engine)
+    with open(args.file) as file:
+        print(bulk.load(engine, bulk.read_ndjson(file), batch_size=args.batch_size,
+                        defer_indexes=args.defer_indexes))
+
+def _load_arguments(parser):
+    parser.add_argument("--batch-size", type=int, default=10_000,
+                        help="rows per insert statement")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="build the message indexes once after loading")
+
+def _prune_changes_arguments(parser):
+    parser.add_argument("--days", type=int, default=db.message_change_retention_days,
+                        help="keep the changes of this many days")
+
+def _seed_arguments(parser):
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--members", type=int, default=20, help="users per chat")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--password", default="password",
+                        help="password of every generated user")
+    _load_arguments(parser)
+
+def _import_arguments(parser):
+    parser.add_argument("file", help="NDJSON file, one record per line")
+    _load_arguments(parser)
+
+commands = {
+    "migrate": migrate,
+    "rebuild-search": rebuild_search,
+    "reconcile-counters": reconcile_counters,
+    "prune-changes": prune_changes,
+    "seed": seed,
+    "import": import_ndjson,
+}
+
+arguments = {
+    "prune-changes": _prune_changes_arguments,
+    "seed": _seed_arguments,
+    "import": _import_arguments,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pony Express maintenance commands")
+    parser.add_argument("--database-url", default=db.database_url)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, command in commands.items():
+        subparser = subparsers.add_parser(name, help=command.__doc__)
+        if name in arguments:
+            arguments[name](subparser)
+
+    args = parser.parse_args(argv)
+    engine = db.build_engine(args.database_url)
+    commands[args.command](engine, args)
+
+if __name__ == "__main__":
+    main()
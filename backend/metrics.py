@@ -0,0 +1,227 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+
+import anyio.to_thread
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend import query_stats
+from backend.cache import principal_cache
+
+# Minimal in-process metrics rendered in the Prometheus text format. Every
+# update is a dict lookup and a few additions under a lock, so recording a
+# request costs a couple of microseconds.
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.type}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        return ()
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: dict[tuple, float] = {} if labels else {(): 0}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {value}"
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+class CallbackMetric(Metric):
+    """A metric whose value is read from a callback at scrape time."""
+
+    def __init__(self, name: str, description: str, callback: Callable[[], float],
+                 type: str = "gauge"):
+        super().__init__(name, description)
+        self.type = type
+        self.callback = callback
+
+    def _samples(self) -> Iterable[str]:
+        yield f"{self.name} {self.callback()}"
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = (
+                     0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                 )):
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+        # per label set: count per bucket (last one is +Inf), then the sum
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            counts, total = self._values.setdefault(
+                label_values, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0])
+                      for labels, (counts, total) in self._values.items()]
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = _format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+requests_total = registry.register(Counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    ("method", "route", "status"),
+))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by method and route template.",
+    ("method", "route"),
+))
+requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled.",
+))
+request_queries = registry.register(Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per request by method and route template.",
+    ("method", "route"),
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100),
+))
+request_db_duration = registry.register(Counter(
+    "http_request_db_seconds_total",
+    "Time spent executing SQL statements by method and route template.",
+    ("method", "route"),
+))
+
+# sync routes and dependencies run on anyio's default thread limiter, so
+# busy == total means requests are queueing for a thread. Only readable
+# from the event loop, which is where /metrics renders.
+registry.register(CallbackMetric(
+    "threadpool_threads_busy",
+    "Worker threads currently running sync routes and dependencies.",
+    lambda: anyio.to_thread.current_default_thread_limiter().borrowed_tokens,
+))
+registry.register(CallbackMetric(
+    "threadpool_threads_total",
+    "Size of the worker thread pool.",
+    lambda: anyio.to_thread.current_default_thread_limiter().total_tokens,
+))
+registry.register(CallbackMetric(
+    "threadpool_tasks_waiting",
+    "Calls waiting for a free worker thread.",
+    lambda: anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting,
+))
+registry.register(CallbackMetric(
+    "auth_principal_cache_hits_total",
+    "Access tokens resolved from the principal cache.",
+    lambda: principal_cache.stats()["hits"],
+    type="counter",
+))
+registry.register(CallbackMetric(
+    "auth_principal_cache_misses_total",
+    "Access tokens that had to be decoded and looked up.",
+    lambda: principal_cache.stats()["misses"],
+    type="counter",
+))
+
+def route_template(scope: Scope) -> str:
+    """The path template of the route that handled a request, e.g. /chats/{chat_id}."""
+    route = scope.get("route")
+    # unmatched paths are lumped together to keep the label set bounded
+    return getattr(route, "path", "unmatched")
+
+class MetricsMiddleware:
+    """
+    Record the count, status, latency and SQL statements of every HTTP request
+    per route template, and report the database time in a Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status: Optional[int] = None
+        stats = query_stats.start(scope)
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # queries made while a body is still streaming are not included
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            requests_in_flight.dec()
+            route = route_template(scope)
+            requests_total.inc(scope["method"], route, status or 500)
+            request_duration.observe(elapsed, scope["method"], route)
+            request_queries.observe(stats.count, scope["method"], route)
+            request_db_duration.inc(scope["method"], route, amount=stats.duration)
@@ -0,0 +1,131 @@
+from sqlalchemy import Connection, Engine, func, inspect, or_, select, update
+from sqlmodel import SQLModel
+
+from backend.entities import ChatInDB, MessageInDB, UserChatLinkInDB
+
+# Each step is idempotent and brings an existing database a little closer to
+# the current models; migrate() simply runs all of them in order.
+
+def _create_tables(connection: Connection):
+    SQLModel.metadata.create_all(connection)
+
+def _add_missing_columns(connection: Connection):
+    # ADD COLUMN only touches the schema, existing rows read the default
+    inspector = inspect(connection)
+    added = connection.info.setdefault("added_columns", set())
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = (f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                   f"{column.type.compile(connection.dialect)}")
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            connection.exec_driver_sql(ddl)
+            added.add((table.name, column.name))
+
+def _create_indexes(connection: Connection):
+    # create_all only creates the indexes of tables it creates itself.
+    # CREATE INDEX builds the new b-tree from the existing rows, the table
+    # itself is not rebuilt.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _backfill_chat_counters(connection: Connection):
+    added = connection.info.get("added_columns", ())
+    if ("chats", "message_count") in added or ("chats", "last_message_id") in added:
+        reconcile_chat_counters(connection)
+
+def reconcile_chat_counters(connection: Connection):
+    """
+    Recompute the denormalized message/user counters of every chat, bumping
+    the version of those whose counters were off.
+    """
+    chats = ChatInDB.__table__
+    messages = MessageInDB.__table__
+    links = UserChatLinkInDB.__table__
+    counters = {
+        "message_count": select(func.count())
+            .where(messages.c.chat_id == chats.c.id).scalar_subquery(),
+        "user_count": select(func.count())
+            .where(links.c.chat_id == chats.c.id).scalar_subquery(),
+        "last_message_at": select(func.max(messages.c.created_at))
+            .where(messages.c.chat_id == chats.c.id).scalar_subquery(),
+        "last_message_id": select(messages.c.id)
+            .where(messages.c.chat_id == chats.c.id)
+            .order_by(messages.c.created_at.desc(), messages.c.id.desc())
+            .limit(1).scalar_subquery(),
+    }
+    # only chats that change get a new version, the others keep their ETags
+    connection.execute(
+        update(chats)
+        .where(or_(*(chats.c[name].is_distinct_from(value) for name, value in counters.items())))
+        .values(version=chats.c.version + 1, **counters)
+    )
+
+def _create_message_search(connection: Connection):
+    # external content FTS5 index over messages.text, kept in sync by
+    # triggers so every write path (including raw inserts) is covered
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+    ).first()
+    for statement in message_search_ddl:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        rebuild_message_search(connection)
+
+message_search_ddl = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+       USING fts5(text, content='messages', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+         INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+         INSERT INTO messages_fts(messages_fts, rowid, text)
+         VALUES ('delete', old.id, old.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+         INSERT INTO messages_fts(messages_fts, rowid, text)
+         VALUES ('delete', old.id, old.text);
+         INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+       END""",
+]
+
+def drop_message_search_triggers(connection: Connection):
+    """Stop indexing message writes, until the next migrate() recreates the triggers."""
+    if connection.dialect.name != "sqlite":
+        return
+    for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+
+def restore_message_search(connection: Connection):
+    """Recreate the search triggers dropped by drop_message_search_triggers and re-index."""
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in message_search_ddl:
+        connection.exec_driver_sql(statement)
+    rebuild_message_search(connection)
+
+def rebuild_message_search(connection: Connection):
+    """Re-index every message, e.g. after rows were written with triggers off."""
+    connection.exec_driver_sql("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+steps = [
+    _create_tables,
+    _add_missing_columns,
+    _create_indexes,
+    _backfill_chat_counters,
+    _create_message_search,
+]
+
+def migrate(engine: Engine):
+    """Create missing tables, columns and indexes, in a single transaction."""
+    with engine.begin() as connection:
+        for step in steps:
+            step(connection)
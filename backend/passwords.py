@@ -0,0 +1,115 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt is deliberately slow (~250 ms at cost 12), so it runs in a small
+# process pool rather than on the request threads where it would hold the
+# GIL. At most max_pending_hashes may be queued; beyond that callers get a
+# 503 instead of piling up behind the pool.
+
+bcrypt_rounds = int(os.environ.get("BCRYPT_ROUNDS", default=12))
+hash_workers = int(os.environ.get("PASSWORD_HASH_WORKERS", default=2))
+max_pending_hashes = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", default=32))
+
+# pinning min and max rounds makes needs_update() flag hashes of any other
+# cost, so they are rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=bcrypt_rounds,
+    bcrypt__min_rounds=bcrypt_rounds,
+    bcrypt__max_rounds=bcrypt_rounds,
+)
+
+class PasswordHasherBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail={
+                "error": "server_busy",
+                "error_description": "too many pending logins, retry shortly",
+            },
+            headers={"Retry-After": "1"},
+        )
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(max_pending_hashes)
+
+def _submit(fn: Callable, *args) -> Future:
+    global _pool
+    if not _pending.acquire(blocking=False):
+        raise PasswordHasherBusy()
+
+    if hash_workers <= 0:
+        # no pool configured, hash on the calling thread
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as error:
+            future.set_exception(error)
+        finally:
+            _pending.release()
+        return future
+
+    try:
+        with _pool_lock:
+            if _pool is None:
+                # not forked: by now the server's worker and group commit
+                # threads are running, and a fork copies their locks mid-use
+                _pool = ProcessPoolExecutor(
+                    max_workers=hash_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        future = _pool.submit(fn, *args)
+    except BaseException:
+        # e.g. a broken or shut down pool, the permit would otherwise leak
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+def hash_password(password: str) -> str:
+    """
+    Hash a password in the hashing pool, blocking until it is done.
+
+    :raises PasswordHasherBusy: if too many hashes are already pending
+    """
+    return _submit(_hash, password).result()
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hash a password in the hashing pool without blocking the event loop.
+
+    :raises PasswordHasherBusy: if too many hashes are already pending
+    """
+    return await asyncio.wrap_future(_submit(_hash, password))
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    """
+    Verify a password in the hashing pool without blocking the event loop.
+
+    :return: whether the password matches, and a new hash if the stored one
+        was made with a different cost factor
+    :raises PasswordHasherBusy: if too many hashes are already pending
+    """
+    return await asyncio.wrap_future(_submit(_verify, password, hashed_password))
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
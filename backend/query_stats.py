@@ -0,0 +1,73 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL accounting. MetricsMiddleware starts a RequestQueryStats
+# for every request; the cursor hooks below add each statement's count and
+# time to it. Sync routes and dependencies run in worker threads with a copy
+# of the request's context, which still points at the same stats object.
+
+slow_query_threshold = float(os.environ.get("SLOW_QUERY_MS", default=100)) / 1000
+
+logger = logging.getLogger("backend.sql")
+
+@dataclass
+class RequestQueryStats:
+    scope: dict = field(default_factory=dict, repr=False)
+    count: int = 0
+    duration: float = 0.0
+
+    @property
+    def route(self) -> str:
+        return getattr(self.scope.get("route"), "path", self.scope.get("path", "-"))
+
+    def server_timing(self) -> str:
+        """The value of a Server-Timing header entry for the database time."""
+        queries = "query" if self.count == 1 else "queries"
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} {queries}"'
+
+_current: ContextVar[Optional[RequestQueryStats]] = ContextVar("query_stats", default=None)
+
+def start(scope: dict) -> RequestQueryStats:
+    """Start accounting the queries made in the current context."""
+    stats = RequestQueryStats(scope)
+    _current.set(stats)
+    return stats
+
+def current() -> Optional[RequestQueryStats]:
+    return _current.get()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += elapsed
+    if elapsed >= slow_query_threshold:
+        # parameters are left out, they may hold password hashes
+        logger.warning(
+            "slow query (%.1f ms) on %s: %s",
+            elapsed * 1000, stats.route if stats else "-", " ".join(statement.split()),
+        )
+
+def _handle_error(exception_context):
+    # after_cursor_execute does not run for failed statements
+    starts = exception_context.connection and exception_context.connection.info.get("query_start")
+    if starts:
+        starts.pop()
+
+def instrument(engine: Engine):
+    """Install the query accounting hooks on an engine (or an async engine's sync engine)."""
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
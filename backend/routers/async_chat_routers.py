@@ -0,0 +1,123 @@
+import asyncio
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlmodel.ext.asyncio.session import AsyncSession
+from backend import async_database as adb
+from backend import group_commit
+from backend import serialization
+from backend.etags import is_not_modified, make_etag, not_modified, set_etag
+from backend.entities import (
+    ChatCollection,
+    ChatSummaryCollection,
+    MessageCollection,
+    MessageResponse,
+    UserInDB,
+    MessageCreate,
+    MessageUpdate,
+    PageMetadata,
+)
+from backend.auth import get_current_user_async
+
+# Routes migrated to the async database path. When ASYNC_DATABASE=1 this
+# router is included ahead of chats_router, so its routes take precedence
+# and everything not yet migrated keeps being served by the sync router.
+
+async_chats_router = APIRouter(prefix="/chats", tags=["Chats"])
+
+@async_chats_router.get("", response_model=Union[ChatCollection, ChatSummaryCollection],
+                        response_model_exclude_none=True)
+async def get_chats(request: Request, response: Response,
+                    order: Literal["name", "recent"] = "name",
+                    after: Optional[str] = None,
+                    limit: int = Query(50, ge=1, le=1000),
+                    user: UserInDB = Depends(get_current_user_async),
+                    session: AsyncSession = Depends(adb.get_async_session)):
+    """
+    Get all chats sorted by name, or with order=recent a page of chats with
+    their last message, most recently active first.
+    """
+    versions = await adb.get_chat_versions(session, user.id)
+    etag = make_etag("chats", user.id, versions,
+                     *((order, after, limit) if order == "recent" else ()))
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    if order == "recent":
+        page = await adb.get_recent_chats(session, user.id, after=after, limit=limit)
+        return ChatSummaryCollection(
+            meta=PageMetadata(count=len(page.chats), next=page.next),
+            chats=page.chats,
+        )
+
+    chats = await adb.get_all_chats(session, user.id)
+
+    return ChatCollection(
+        meta={"count": len(chats)},
+        chats=sorted(chats, key=lambda chat: chat.name),
+    )
+
+
+@async_chats_router.get("/{chat_id}/messages", response_model=MessageCollection,
+                        response_model_exclude_none=True)
+async def get_chat_messages(chat_id: str,
+                            request: Request,
+                            response: Response,
+                            before: Optional[str] = None,
+                            after: Optional[str] = None,
+                            limit: Optional[int] = Query(None, ge=1, le=1000),
+                            user: UserInDB = Depends(get_current_user_async),
+                            session: AsyncSession = Depends(adb.get_async_session)):
+    """Gets a page of a chats messages by chat id, oldest first."""
+    version = await adb.get_chat_version(session, chat_id, user.id)
+    etag = make_etag("messages", chat_id, version, before, after, limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    page = await adb.get_chat_messages(session, chat_id, user.id,
+                                       before=before, after=after, limit=limit)
+    if serialization.fast_json:
+        return serialization.FastJSONResponse(
+            serialization.message_collection(page.messages, page.next, page.prev),
+            headers=response.headers,
+        )
+
+    return MessageCollection(
+        meta=PageMetadata(count=len(page.messages), next=page.next, prev=page.prev),
+        messages=page.messages,
+    )
+
+
+@async_chats_router.post("/{chat_id}/messages", status_code=201,
+                         response_model=MessageResponse)
+async def create_new_message(chat_id: int,
+                             text: MessageCreate,
+                             user: UserInDB = Depends(get_current_user_async),
+                             session: AsyncSession = Depends(adb.get_async_session)):
+    """Create a new message for the current user."""
+    if group_commit.writer is not None:
+        message = await asyncio.wrap_future(
+            group_commit.writer.submit(chat_id, user.id, text.text)
+        )
+    else:
+        message = await adb.create_message(session, chat_id, user.id, text.text)
+    return MessageResponse(message=message)
+
+
+@async_chats_router.put("/{chat_id}/messages/{message_id}",
+                        response_model=MessageResponse)
+async def update_message(chat_id: int, message_id: int,
+                         message: MessageUpdate,
+                         user: UserInDB = Depends(get_current_user_async),
+                         session: AsyncSession = Depends(adb.get_async_session)):
+    """Updates a message in a certain chat"""
+    message = await adb.update_message(session, chat_id, message_id, message, user.id)
+    return MessageResponse(message=message)
+
+@async_chats_router.delete("/{chat_id}/messages/{message_id}", status_code=204)
+async def delete_message(chat_id: int, message_id: int,
+                         user: UserInDB = Depends(get_current_user_async),
+                         session: AsyncSession = Depends(adb.get_async_session)):
+    """Deletes a message in a certain chat"""
+    await adb.delete_message(session, chat_id, message_id, user.id)
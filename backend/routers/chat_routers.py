@@ -1,9 +1,18 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, Query
+import asyncio
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from backend import database as db
+from backend import events
+from backend import group_commit
+from backend import serialization
+from backend.etags import is_not_modified, make_etag, not_modified, set_etag
+from sqlalchemy import Engine
 from sqlmodel import Session
 from backend.entities import (
     ChatCollection,
+    ChatSummaryCollection,
     ChatUpdate,
     MessageCollection,
     ChatResponse,
@@ -13,16 +22,42 @@ from backend.entities import (
     ChatResponseWithMeta,
     ChatMetadata,
     MessageCreate,
+    MessageBatchCreate,
     MessageUpdate,
+    PageMetadata,
 )
-from backend.auth import get_current_user
+from backend.auth import get_current_user, _decode_access_token
 
 chats_router = APIRouter(prefix="/chats", tags=["Chats"])
 
-@chats_router.get("", response_model=ChatCollection)
-def get_chats(user: UserInDB = Depends(get_current_user),
+# messages per fetch and per chunk of an export stream
+export_batch_size = 1000
+
+@chats_router.get("", response_model=Union[ChatCollection, ChatSummaryCollection],
+                  response_model_exclude_none=True)
+def get_chats(request: Request, response: Response,
+              order: Literal["name", "recent"] = "name",
+              after: Optional[str] = None,
+              limit: int = Query(50, ge=1, le=1000),
+              user: UserInDB = Depends(get_current_user),
               session: Session = Depends(db.get_session)):
-    """Get all chats sorted by name."""
+    """
+    Get all chats sorted by name, or with order=recent a page of chats with
+    their last message, most recently active first.
+    """
+    etag = make_etag("chats", user.id, db.get_chat_versions(session, user.id),
+                     *((order, after, limit) if order == "recent" else ()))
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    if order == "recent":
+        page = db.get_recent_chats(session, user.id, after=after, limit=limit)
+        return ChatSummaryCollection(
+            meta=PageMetadata(count=len(page.chats), next=page.next),
+            chats=page.chats,
+        )
+
     chats = db.get_all_chats(session, user.id)
 
     return ChatCollection(
@@ -31,29 +66,52 @@ def get_chats(user: UserInDB = Depends(get_current_user),
     )
 
 
+@chats_router.get("/search", response_model=MessageCollection,
+                  response_model_exclude_none=True)
+def search_messages(q: str = Query(min_length=1),
+                    limit: int = Query(20, ge=1, le=100),
+                    offset: int = Query(0, ge=0),
+                    user: UserInDB = Depends(get_current_user),
+                    session: Session = Depends(db.get_session)):
+    """Search the messages of all the current users chats, best match first."""
+    messages = db.search_messages(session, user.id, q, limit=limit, offset=offset)
+
+    return MessageCollection(
+        meta=PageMetadata(count=len(messages)),
+        messages=messages,
+    )
+
+
 @chats_router.get("/{chat_id}", response_model=ChatResponseWithMeta,
                   description="Get a chat for a given chat id.",
                   response_model_exclude_none=True)
 def get_chat(chat_id: str,
+             request: Request,
+             response: Response,
              include: list[str] = Query(None),
              user: UserInDB = Depends(get_current_user),
              session: Session = Depends(db.get_session),
              ):
     """Get a chat by id."""
     chat = db.get_chat_by_id(session, chat_id, user.id)
+    etag = make_etag("chat", chat.id, chat.version, sorted(include or []))
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
 
     # get messages and users
     messages = None
     users = None
     if(include is not None and "messages" in include):
-        messages = chat.messages
+        messages = db.get_chat_messages(session, chat.id, user.id).messages
     if(include is not None and "users" in include):
-        users = chat.users
+        users = db.get_chat_users(session, chat.id, user.id)
 
     return ChatResponseWithMeta(
         meta=ChatMetadata(
-            message_count = len(chat.messages),
-            user_count = len(chat.users),
+            message_count = chat.message_count,
+            user_count = chat.user_count,
+            last_message_at = chat.last_message_at,
         ),
         chat = chat,
         messages = messages,
@@ -69,29 +127,107 @@ def update_chat(chat_id: str, chat_update: ChatUpdate,
     return ChatResponse(chat=db.update_chat(session, chat_id, user.id, chat_update))
 
 
-@chats_router.get("/{chat_id}/messages", response_model=MessageCollection)
-def get_chat_messages(chat_id: str, 
+@chats_router.get("/{chat_id}/messages", response_model=MessageCollection,
+                  response_model_exclude_none=True)
+def get_chat_messages(chat_id: str,
+                   request: Request,
+                   response: Response,
+                   before: Optional[str] = None,
+                   after: Optional[str] = None,
+                   limit: Optional[int] = Query(None, ge=1, le=1000),
                    user: UserInDB = Depends(get_current_user),
                    session: Session = Depends(db.get_session)):
-    """Gets a chats messages by chat id."""
-    messages = db.get_chat_messages(session, chat_id, user.id)
+    """Gets a page of a chats messages by chat id, oldest first."""
+    chat = db.get_chat_by_id(session, chat_id, user.id)
+    etag = make_etag("messages", chat.id, chat.version, before, after, limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    page = db.get_chat_messages(session, chat.id, user.id,
+                                before=before, after=after, limit=limit)
+    if serialization.fast_json:
+        return serialization.FastJSONResponse(
+            serialization.message_collection(page.messages, page.next, page.prev),
+            headers=response.headers,
+        )
+
+    return MessageCollection(
+        meta=PageMetadata(count=len(page.messages), next=page.next, prev=page.prev),
+        messages=page.messages,
+    )
+
+
+@chats_router.get("/{chat_id}/export", response_class=StreamingResponse,
+                  responses={200: {"content": {"application/x-ndjson": {}}}})
+def export_chat_messages(chat_id: str,
+                         after: Optional[str] = None,
+                         user: UserInDB = Depends(get_current_user),
+                         session: Session = Depends(db.get_session)):
+    """
+    Stream all messages of a chat as NDJSON, oldest first, one message per line.
+    Every line carries a cursor; pass the cursor of the last line received as
+    after to resume an export, even if that message was deleted since.
+    """
+    chat = db.get_chat_by_id(session, chat_id, user.id)
+    key = db.decode_message_cursor(after) if after is not None else None
+
+    return StreamingResponse(
+        _export_lines(session.get_bind(), chat.id, key),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="chat-{chat.id}.ndjson"'},
+    )
+
+def _export_lines(bind: Engine, chat_id: int, after):
+    # the request's session is closed before the body is sent, so the
+    # stream reads through a session of its own
+    with Session(bind) as session:
+        for messages in db.iter_chat_messages(session, chat_id, after=after,
+                                               batch_size=export_batch_size):
+            for message in messages:
+                message["cursor"] = db.encode_message_key(message["created_at"],
+                                                          message["id"])
+            yield serialization.ndjson(messages)
+
+
+@chats_router.get("/{chat_id}/search", response_model=MessageCollection,
+                  response_model_exclude_none=True)
+def search_chat_messages(chat_id: str,
+                         q: str = Query(min_length=1),
+                         limit: int = Query(20, ge=1, le=100),
+                         offset: int = Query(0, ge=0),
+                         user: UserInDB = Depends(get_current_user),
+                         session: Session = Depends(db.get_session)):
+    """Search the messages of a chat, best match first."""
+    messages = db.search_messages(session, user.id, q, chat_id=chat_id,
+                                  limit=limit, offset=offset)
 
     return MessageCollection(
-        meta={"count": len(messages)},
-        messages=sorted(messages, key=lambda message: message.created_at),
+        meta=PageMetadata(count=len(messages)),
+        messages=messages,
     )
 
 
 @chats_router.get("/{chat_id}/users", response_model=UserCollection)
 def get_chat_users(chat_id: str, 
+                   request: Request,
+                   response: Response,
+                   limit: Optional[int] = Query(None, ge=1, le=1000),
+                   offset: int = Query(0, ge=0),
                    user: UserInDB = Depends(get_current_user),
                    session: Session = Depends(db.get_session)):
-    """Gets a chats users by chat id."""
-    users = db.get_chat_users(session, chat_id, user.id)
+    """Gets a chats users by chat id, sorted by ID."""
+    chat = db.get_chat_by_id(session, chat_id, user.id)
+    etag = make_etag("users", chat.id, chat.version, limit, offset)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+
+    users = db.get_chat_users(session, chat.id, user.id, limit=limit, offset=offset)
 
     return UserCollection(
         meta={"count": len(users)},
-        users=sorted(users, key=lambda user: user.id),
+        users=users,
     )
 
 @chats_router.post("/{chat_id}/messages", status_code=201, response_model=MessageResponse)
@@ -101,10 +237,28 @@ def create_new_message(chat_id: int,
                        session: Session = Depends(db.get_session)
                        ):
     """Create a new message for the current user."""
-    message = db.create_message(session, chat_id, user.id, text.text)
+    if group_commit.writer is not None:
+        message = group_commit.writer.create_message(chat_id, user.id, text.text)
+    else:
+        message = db.create_message(session, chat_id, user.id, text.text)
     return MessageResponse(message=message)
 
 
+@chats_router.post("/{chat_id}/messages:batch", status_code=201,
+                   response_model=MessageCollection, response_model_exclude_none=True)
+def create_new_messages(chat_id: int,
+                        batch: MessageBatchCreate,
+                        user: UserInDB = Depends(get_current_user),
+                        session: Session = Depends(db.get_session)):
+    """Create several messages for the current user at once, all or none."""
+    messages = db.create_messages(session, chat_id, user.id,
+                                  [message.text for message in batch.messages])
+    return MessageCollection(
+        meta=PageMetadata(count=len(messages)),
+        messages=messages,
+    )
+
+
 @chats_router.put("/{chat_id}/messages/{message_id}", response_model=MessageResponse)
 def update_message(chat_id: int, message_id: int,
                  message: MessageUpdate,
@@ -119,4 +273,53 @@ def delete_message(chat_id: int, message_id: int,
                 user: UserInDB = Depends(get_current_user),
                 session: Session = Depends(db.get_session)):
     """Deletes a message in a certain chat"""
-    db.delete_message(session, chat_id, message_id, user.id)
\ No newline at end of file
+    db.delete_message(session, chat_id, message_id, user.id)
+
+@chats_router.websocket("/{chat_id}/ws")
+async def chat_events(websocket: WebSocket, chat_id: int,
+                      token: Optional[str] = None,
+                      session: Session = Depends(db.get_session)):
+    """
+    Push message_created, message_updated and message_deleted events for a chat.
+
+    Browsers cannot set headers on websockets, so the access token may be
+    passed as the token query parameter instead of the Authorization header.
+    """
+    if token is None:
+        scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = None
+    try:
+        await run_in_threadpool(_authorize_subscription, session, token, chat_id)
+    except (HTTPException, db.EntityNotFoundException):
+        await websocket.close(code=1008)
+        return
+
+    subscription = events.hub.subscribe(chat_id)
+    await websocket.accept()
+    watcher = asyncio.create_task(_watch_disconnect(websocket, subscription))
+    try:
+        while (event := await subscription.get()) is not None:
+            await websocket.send_json(event)
+        if subscription.overflowed:
+            await websocket.close(code=1013)
+    finally:
+        events.hub.unsubscribe(subscription)
+        watcher.cancel()
+
+def _authorize_subscription(session: Session, token: Optional[str], chat_id: int):
+    try:
+        if token is None:
+            raise HTTPException(status_code=401)
+        user = _decode_access_token(session, token)
+        db.get_chat_by_id(session, chat_id, user.id)
+    finally:
+        # the socket may stay open for hours, do not hold a connection for it
+        session.close()
+
+async def _watch_disconnect(websocket: WebSocket, subscription: events.Subscription):
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        subscription.close()
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from backend.metrics import registry
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse,
+                    include_in_schema=False)
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format."""
+    # async so the thread pool gauges are read from the event loop
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
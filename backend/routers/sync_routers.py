@@ -0,0 +1,36 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from backend import database as db
+from sqlmodel import Session
+from backend.entities import (
+    DeletedMessage,
+    SyncResponse,
+    UserInDB,
+)
+from backend.auth import get_current_user
+
+sync_router = APIRouter(prefix="/sync", tags=["Sync"])
+
+@sync_router.get("", response_model=SyncResponse)
+def sync(since: Optional[str] = None,
+         limit: int = Query(500, ge=1, le=5000),
+         user: UserInDB = Depends(get_current_user),
+         session: Session = Depends(db.get_session)):
+    """
+    Get the messages created, edited and deleted in the current users chats
+    since a watermark. Call without one to get the current watermark, and
+    again with the returned watermark while has_more is true. A 410 means
+    the changes since the watermark are no longer kept: reload everything
+    and start over without a watermark.
+    """
+    changes = db.get_message_changes(session, user.id, since, limit=limit)
+
+    return SyncResponse(
+        watermark=changes.watermark,
+        has_more=changes.has_more,
+        messages=changes.messages,
+        deleted=[
+            DeletedMessage(id=change.message_id, chat_id=change.chat_id)
+            for change in changes.deleted
+        ],
+    )
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
 from backend import database as db
 from sqlmodel import Session
 from backend.entities import (
@@ -46,11 +47,14 @@ def get_user(user_id: int, session: Session = Depends(db.get_session)):
 
 
 @users_router.get("/{user_id}/chats", response_model=ChatCollection)
-def get_users_chats(user_id: int, session: Session = Depends(db.get_session)):
-    """Gets all chats from a user by user id."""
-    chats = db.get_users_chats(session, user_id)
+def get_users_chats(user_id: int,
+                    limit: Optional[int] = Query(None, ge=1, le=1000),
+                    offset: int = Query(0, ge=0),
+                    session: Session = Depends(db.get_session)):
+    """Gets all chats from a user by user id, sorted by name."""
+    chats = db.get_users_chats(session, user_id, limit=limit, offset=offset)
 
     return ChatCollection(
         meta={"count": len(chats)},
-        chats=sorted(chats, key=lambda chat: chat.name),
-    )
\ No newline at end of file
+        chats=chats,
+    )
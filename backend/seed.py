@@ -0,0 +1,200 @@
+import json
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, TextIO
+
+from sqlalchemy import Connection, Engine, func, insert, select
+
+from backend import migrations
+from backend import passwords
+from backend.entities import ChatInDB, MessageInDB, UserChatLinkInDB, UserInDB
+
+# Bulk loading for staging and benchmark datasets. Records are buffered per
+# table and written with executemany in batches, committing every
+# transaction_rows rows, instead of one ORM flush and commit per message.
+# Counters, the search index and (optionally) the secondary indexes are
+# brought up to date once at the end. Loaded messages are not added to the
+# message change log, so /sync clients pick them up with a full sync.
+
+tables = {
+    # in foreign key order, buffers are flushed in this order
+    "user": UserInDB.__table__,
+    "chat": ChatInDB.__table__,
+    "membership": UserChatLinkInDB.__table__,
+    "message": MessageInDB.__table__,
+}
+
+# the big tables, whose secondary indexes are cheaper to build once at the end
+deferrable_tables = [MessageInDB.__table__, UserChatLinkInDB.__table__]
+
+@dataclass
+class LoadReport:
+    rows: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    elapsed: float = 0.0
+
+    def __str__(self) -> str:
+        total = sum(self.rows.values())
+        counts = ", ".join(f"{count} {kind}s" for kind, count in self.rows.items())
+        return (f"loaded {counts} in {self.elapsed:.1f} s "
+                f"({total / max(self.elapsed, 1e-9):,.0f} rows/s)")
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def read_ndjson(file: TextIO) -> Iterator[tuple[str, dict]]:
+    """
+    Read records from newline delimited JSON, one object per line with a
+    ``type`` of user, chat, membership or message and the table's columns.
+    Users may give a ``password`` instead of a ``hashed_password``.
+    """
+    hashes = {}
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        kind = row.pop("type", None)
+        if kind not in tables:
+            raise ValueError(f"line {line_number}: unknown record type {kind!r}")
+        if "password" in row:
+            password = row.pop("password")
+            if password not in hashes:
+                hashes[password] = passwords.hash_password(password)
+            row["hashed_password"] = hashes[password]
+        for column in ("created_at", "last_message_at"):
+            if column in row:
+                row[column] = _datetime(row[column])
+        yield kind, row
+
+def generate(engine: Engine, users: int, chats: int, members: int,
+             messages: int, password: str = "password",
+             seed: int = 0) -> Iterator[tuple[str, dict]]:
+    """
+    Generate a synthetic dataset, with ids following the existing rows.
+
+    :param members: users per chat
+    :param password: password of every generated user
+    """
+    with engine.connect() as connection:
+        user_start = connection.execute(select(func.max(UserInDB.id))).scalar() or 0
+        chat_start = connection.execute(select(func.max(ChatInDB.id))).scalar() or 0
+    return _generate(users, chats, members, messages, password, seed,
+                     user_start, chat_start)
+
+def _generate(users, chats, members, messages, password, seed, user_start, chat_start):
+    rng = random.Random(seed)
+    # one hash for everyone, bcrypt per user would dominate the load time
+    hashed_password = passwords.hash_password(password)
+    start = datetime.now() - timedelta(seconds=messages)
+
+    user_ids = range(user_start + 1, user_start + users + 1)
+    for user_id in user_ids:
+        yield "user", {
+            "id": user_id,
+            "username": f"user{user_id}",
+            "email": f"user{user_id}@example.com",
+            "hashed_password": hashed_password,
+            "created_at": start,
+        }
+
+    chat_members = {}
+    for chat_id in range(chat_start + 1, chat_start + chats + 1):
+        chat_members[chat_id] = rng.sample(user_ids, min(members, users))
+        yield "chat", {
+            "id": chat_id,
+            "name": f"chat {chat_id}",
+            "owner_id": chat_members[chat_id][0],
+            "created_at": start,
+        }
+        for user_id in chat_members[chat_id]:
+            yield "membership", {"user_id": user_id, "chat_id": chat_id}
+
+    chat_ids = list(chat_members)
+    for i in range(messages):
+        chat_id = rng.choice(chat_ids)
+        yield "message", {
+            "text": f"message {i} in chat {chat_id}",
+            "chat_id": chat_id,
+            "user_id": rng.choice(chat_members[chat_id]),
+            "created_at": start + timedelta(seconds=i),
+        }
+
+def _drop_deferred_indexes(connection: Connection):
+    for table in deferrable_tables:
+        for index in table.indexes:
+            index.drop(connection, checkfirst=True)
+    migrations.drop_message_search_triggers(connection)
+
+def _restore_deferred_indexes(connection: Connection):
+    for table in deferrable_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    migrations.restore_message_search(connection)
+
+def load(engine: Engine, records: Iterable[tuple[str, dict]],
+         batch_size: int = 10_000, transaction_rows: int = 500_000,
+         defer_indexes: bool = False) -> LoadReport:
+    """
+    Bulk insert records into an already migrated database.
+
+    Rows of the same type may leave out different optional columns; a
+    missing created_at is set to the time of the load.
+
+    :param records: (type, row) pairs, e.g. from generate() or read_ndjson()
+    :param batch_size: rows per executemany
+    :param transaction_rows: rows per transaction
+    :param defer_indexes: drop the secondary indexes and search triggers of
+        the message and membership tables during the load, and rebuild them
+        at the end
+    :return: rows loaded per type and the time it took
+    """
+    report = LoadReport()
+    start = time.perf_counter()
+    loaded_at = datetime.now()
+    buffers: dict[str, list[dict]] = {kind: [] for kind in tables}
+
+    def flush(connection: Connection):
+        for kind, rows in buffers.items():
+            # one executemany per set of columns, they must all be bound
+            by_columns = defaultdict(list)
+            for row in rows:
+                by_columns[frozenset(row)].append(row)
+            for group in by_columns.values():
+                connection.execute(insert(tables[kind]), group)
+            report.rows[kind] += len(rows)
+            rows.clear()
+
+    if defer_indexes:
+        with engine.begin() as connection:
+            _drop_deferred_indexes(connection)
+    try:
+        with engine.connect() as connection:
+            # connections begin a transaction on first execute, commit() ends it
+            pending = 0
+            for kind, row in records:
+                if "created_at" in tables[kind].c and row.get("created_at") is None:
+                    row["created_at"] = loaded_at
+                buffers[kind].append(row)
+                pending += 1
+                if len(buffers[kind]) >= batch_size:
+                    flush(connection)
+                if pending >= transaction_rows:
+                    flush(connection)
+                    connection.commit()
+                    pending = 0
+            flush(connection)
+            connection.commit()
+    finally:
+        if defer_indexes:
+            # also after a failed load, so neither the indexes nor the search
+            # index are left out of date
+            with engine.begin() as connection:
+                _restore_deferred_indexes(connection)
+
+    with engine.begin() as connection:
+        migrations.reconcile_chat_counters(connection)
+
+    report.elapsed = time.perf_counter() - start
+    return report
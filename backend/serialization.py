@@ -0,0 +1,69 @@
+import json
+import os
+from datetime import datetime
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency, only needed for the fast path
+    orjson = None
+
+# Opt-in fast path for large listings. Instead of building the response
+# models, having FastAPI validate them a second time against response_model
+# and encoding the result with the stdlib json module, rows are projected
+# straight into dicts (the database already guarantees their shape) and
+# encoded once with orjson.
+
+fast_json = os.environ.get("FAST_JSON", default="0") == "1" and orjson is not None
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, which natively handles datetimes."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+def user_to_dict(user) -> dict:
+    """Project a user onto the User response shape."""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "created_at": user.created_at,
+    }
+
+def message_to_dict(message) -> dict:
+    """Project a message onto the Message response shape."""
+    return {
+        "id": message.id,
+        "text": message.text,
+        "chat_id": message.chat_id,
+        "user": user_to_dict(message.user),
+        "created_at": message.created_at,
+    }
+
+def message_collection(messages, next=None, prev=None) -> dict:
+    """Project a page of messages onto the MessageCollection shape."""
+    meta = {"count": len(messages)}
+    if next is not None:
+        meta["next"] = next
+    if prev is not None:
+        meta["prev"] = prev
+    return {
+        "meta": meta,
+        "messages": [message_to_dict(message) for message in messages],
+    }
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def ndjson(objects) -> bytes:
+    """Encode objects as newline delimited JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return b"".join(orjson.dumps(obj) + b"\n" for obj in objects)
+    return "".join(
+        json.dumps(obj, default=_json_default, separators=(",", ":")) + "\n"
+        for obj in objects
+    ).encode()
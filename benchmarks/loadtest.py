@@ -0,0 +1,228 @@
+"""
+Load test the API with a synthetic workload, in-process or against a server.
+
+    python -m benchmarks.loadtest --profile mixed --concurrency 50 --duration 30
+    python -m benchmarks.loadtest --url http://localhost:8000 --database-url sqlite:///backend/pony_express.db
+
+In-process runs drive the app through httpx's ASGI transport against a fresh
+sqlite file. With --url the requests go over HTTP to a running server, which
+must use the database passed as --database-url so the seeded users exist
+(add --no-seed to reuse users seeded by an earlier run).
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+password = "loadtest"
+
+# relative weights of the operations a virtual user picks from
+profiles = {
+    "mixed": {"list_chats": 20, "read_messages": 50, "post_message": 20, "edit_message": 5, "login": 5},
+    "read-heavy": {"list_chats": 25, "read_messages": 70, "post_message": 5},
+    "chatty": {"read_messages": 40, "post_message": 50, "edit_message": 10},
+    "login-storm": {"login": 80, "list_chats": 20},
+}
+
+def parse_mix(value: str) -> dict[str, int]:
+    """Parse a custom mix like ``read_messages=7,post_message=3``."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in operations:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = int(weight or 1)
+    return mix
+
+#   -------- Seeding --------   #
+
+def seed(database_url: str, users: int, chats: int, members: int, messages: int):
+    """Fill the database with users, chats, memberships and messages."""
+    from backend import database as db
+    from backend import seed as bulk
+
+    engine = db.build_engine(database_url)
+    db.create_db_and_tables(engine)
+    records = bulk.generate(engine, users, chats, members, messages, password=password)
+    print(bulk.load(engine, records, defer_indexes=True))
+    engine.dispose()
+
+#   -------- Workload --------   #
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, username: str, rng: random.Random):
+        self.client = client
+        self.username = username
+        self.rng = rng
+        self.headers = {}
+        self.chat_ids: list[int] = []
+        self.own_messages: list[tuple[int, int]] = []
+
+    async def start(self, stats: "Stats") -> bool:
+        """Log in and list the user's chats, whether both succeeded."""
+        await login(self, stats)
+        response = await stats.timed("GET /chats", self.client.get("/chats", headers=self.headers))
+        if response.status_code != 200:
+            return False
+        self.chat_ids = [chat["id"] for chat in response.json()["chats"]]
+        return bool(self.headers)
+
+async def login(user: VirtualUser, stats: "Stats"):
+    response = await stats.timed("POST /auth/token", user.client.post(
+        "/auth/token", data={"username": user.username, "password": password},
+    ))
+    if response.status_code == 200:
+        user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def list_chats(user: VirtualUser, stats: "Stats"):
+    await stats.timed("GET /chats", user.client.get("/chats", headers=user.headers))
+
+async def read_messages(user: VirtualUser, stats: "Stats"):
+    if user.chat_ids:
+        chat_id = user.rng.choice(user.chat_ids)
+        await stats.timed("GET /chats/{chat_id}/messages", user.client.get(
+            f"/chats/{chat_id}/messages", params={"limit": 50}, headers=user.headers,
+        ))
+
+async def post_message(user: VirtualUser, stats: "Stats"):
+    if user.chat_ids:
+        chat_id = user.rng.choice(user.chat_ids)
+        response = await stats.timed("POST /chats/{chat_id}/messages", user.client.post(
+            f"/chats/{chat_id}/messages", json={"text": "load test message"},
+            headers=user.headers,
+        ))
+        if response.status_code == 201:
+            user.own_messages.append((chat_id, response.json()["message"]["id"]))
+
+async def edit_message(user: VirtualUser, stats: "Stats"):
+    if user.own_messages:
+        chat_id, message_id = user.rng.choice(user.own_messages)
+        await stats.timed("PUT /chats/{chat_id}/messages/{message_id}", user.client.put(
+            f"/chats/{chat_id}/messages/{message_id}", json={"text": "edited"},
+            headers=user.headers,
+        ))
+    else:
+        await post_message(user, stats)
+
+operations = {
+    "login": login,
+    "list_chats": list_chats,
+    "read_messages": read_messages,
+    "post_message": post_message,
+    "edit_message": edit_message,
+}
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.failed_starts = 0
+
+    async def timed(self, route: str, request) -> httpx.Response:
+        start = time.perf_counter()
+        response = await request
+        self.latencies[route].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+def report(stats: Stats, elapsed: float):
+    print(f"{'route':<44} {'count':>7} {'err':>5} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    total = 0
+    for route, latencies in sorted(stats.latencies.items()):
+        latencies.sort()
+        total += len(latencies)
+        print(f"{route:<44} {len(latencies):>7} {stats.errors[route]:>5} "
+              f"{len(latencies) / elapsed:>8.1f} "
+              + " ".join(f"{percentile(latencies, p) * 1000:>8.1f}" for p in (50, 95, 99)))
+    print(f"{total} requests in {elapsed:.1f} s, {total / elapsed:.1f} req/s")
+    if stats.failed_starts:
+        print(f"{stats.failed_starts} virtual users could not log in or list their chats")
+
+async def run(client: httpx.AsyncClient, args) -> tuple[Stats, float]:
+    mix = args.mix or profiles[args.profile]
+    names, weights = list(mix), list(mix.values())
+    stats = Stats()
+    rng = random.Random(args.seed)
+    virtual_users = [
+        VirtualUser(client, f"user{rng.randint(1, args.users)}", random.Random(rng.random()))
+        for _ in range(args.concurrency)
+    ]
+    # logins before the clock starts are not part of the measured workload
+    started = await asyncio.gather(*(user.start(Stats()) for user in virtual_users))
+    stats.failed_starts = started.count(False)
+
+    deadline = time.perf_counter() + args.duration
+
+    async def loop(user: VirtualUser):
+        while time.perf_counter() < deadline:
+            operation = user.rng.choices(names, weights)[0]
+            await operations[operation](user, stats)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(loop(user) for user in virtual_users))
+    return stats, time.perf_counter() - start
+
+def in_process_client(app) -> httpx.AsyncClient:
+    """A client driving the app directly, with its errors answered as 500s."""
+    # by default the transport re-raises app exceptions, ending the whole run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="base url of a running server, in-process if omitted")
+    parser.add_argument("--database-url", help="database to seed, a temporary file by default")
+    parser.add_argument("--no-seed", action="store_true", help="reuse an already seeded database")
+    parser.add_argument("--profile", choices=profiles, default="mixed")
+    parser.add_argument("--mix", type=parse_mix, help="custom weights, e.g. read_messages=7,post_message=3")
+    parser.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--members", type=int, default=25, help="users per chat")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the workload")
+    args = parser.parse_args()
+
+    if args.database_url is None:
+        if args.url:
+            parser.error("--database-url is required with --url")
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/loadtest.db"
+    # backend.database builds its engine from DATABASE_URL on import
+    os.environ["DATABASE_URL"] = args.database_url
+
+    if not args.no_seed:
+        seed(args.database_url, args.users, args.chats, args.members, args.messages)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        from backend.main import app
+        client = in_process_client(app)
+
+    async def go():
+        async with client:
+            return await run(client, args)
+
+    try:
+        stats, elapsed = asyncio.run(go())
+    finally:
+        if not args.url:
+            from backend import passwords
+            passwords.shutdown()
+    report(stats, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import { useQuery } from "react-query";
+import { useEffect } from "react";
+import { useQuery, useQueryClient } from "react-query";
 import { useNavigate, useParams } from "react-router-dom";
 import NewMessage from "./NewMessage";
 import ScrollContainer from "./ScrollContainer";
@@ -22,9 +23,48 @@ function Chat() {
     const api = useApi(token);
 
     const navigate = useNavigate();
+    const queryClient = useQueryClient();
+    const queryKey = ["messages", chatId, token];
+
+    // apply pushed changes to the cached messages instead of re-fetching them
+    useEffect(() => {
+        if (!chatId || !isLoggedIn) {
+            return;
+        }
+        const socket = api.socket(`/chats/${chatId}/ws`);
+        socket.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            queryClient.setQueryData(queryKey, (old) => {
+                if (!old?.messages) {
+                    return old;
+                }
+                let messages = old.messages;
+                if (data.type === "message_created") {
+                    messages = [...messages, data.message];
+                } else if (data.type === "message_updated") {
+                    messages = messages.map((message) => (
+                        message.id === data.message.id ? data.message : message
+                    ));
+                } else if (data.type === "message_deleted") {
+                    messages = messages.filter((message) => (
+                        message.id !== data.message_id
+                    ));
+                }
+                return { ...old, meta: { ...old.meta, count: messages.length }, messages };
+            });
+        };
+        // events may have been missed while the socket was down
+        socket.onclose = () => queryClient.invalidateQueries(queryKey);
+        return () => {
+            socket.onclose = null;
+            socket.close();
+        };
+    }, [chatId, token]);
+
     const { data, isloading } = useQuery({
-        queryKey: ["messages", chatId, token],
+        queryKey,
         enabled: isLoggedIn,
+        refetchOnWindowFocus: false,
         queryFn: () => (
             chatId ?
                 api.get(`/chats/${chatId}/messages`)
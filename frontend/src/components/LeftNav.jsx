@@ -1,6 +1,6 @@
 import { useState } from "react";
 import { NavLink } from "react-router-dom";
-import { useQuery } from "react-query";
+import { useInfiniteQuery } from "react-query";
 import { useApi } from "../hooks";
 
 const emptyChat = (id) => ({
@@ -21,7 +21,14 @@ function Link({ chat }) {
     ].join(" ");
 
     const chatName = ({ isActive }) => (
-        (isActive ? "\u00bb " : "") + chat.name
+        <div className="flex flex-col min-w-0">
+            <span>{(isActive ? "\u00bb " : "") + chat.name}</span>
+            {chat.last_message && (
+                <span className="text-xs font-normal truncate opacity-75">
+                    {chat.last_message.text}
+                </span>
+            )}
+        </div>
     );
 
     return (
@@ -35,27 +42,59 @@ function LeftNav() {
     const [search, setSearch] = useState("");
     const api = useApi();
 
-    const { data } = useQuery({
+    // most recently active first, with a preview of the last message; one
+    // page up front, the next ones as the list is scrolled to its end
+    const { data, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
         queryKey: ["chats"],
-        queryFn: () => (
-            api.get("/chats")
-                .then((response) => response.json())
-        ),
+        queryFn: ({ pageParam }) => {
+            const params = new URLSearchParams({ order: "recent", limit: 100 });
+            if (pageParam) {
+                params.set("after", pageParam);
+            }
+            return api.get(`/chats?${params}`)
+                .then((response) => response.json());
+        },
+        getNextPageParam: (lastPage) => lastPage.meta?.next,
     });
 
+    const loadMore = () => {
+        if (hasNextPage && !isFetchingNextPage) {
+            fetchNextPage();
+        }
+    };
+
+    const onScroll = (e) => {
+        const { scrollTop, scrollHeight, clientHeight } = e.currentTarget;
+        if (scrollHeight - scrollTop - clientHeight < 100) {
+            loadMore();
+        }
+    };
+
     const regex = new RegExp(search.split("").join(".*"));
 
-    const chats = (data?.chats || [1, 2, 3].map(emptyChat)
+    const chats = (data?.pages.flatMap((page) => page.chats) || [1, 2, 3].map(emptyChat)
     ).filter((chat) => (
         search === "" || regex.test(chat.name)
     ));
 
     return (
         <nav className="flex flex-col border-r-2 border-emerald-500 h-main">
-            <div className="flex flex-col overflow-y-scroll border-b-2 border-emerald-500 scrollbar-hide">
+            <div
+                className="flex flex-col overflow-y-scroll border-b-2 border-emerald-500 scrollbar-hide"
+                onScroll={onScroll}
+            >
                 {chats.map((chat) => (
                     <Link key={chat.id} chat={chat} />
                 ))}
+                {hasNextPage && (
+                    <button
+                        className="p-2 text-left italic hover:bg-zinc-900 hover:text-emerald-500"
+                        disabled={isFetchingNextPage}
+                        onClick={loadMore}
+                    >
+                        {isFetchingNextPage ? "loading..." : "load more"}
+                    </button>
+                )}
             </div>
             <div className="p-2">
                 <input
@@ -1,7 +1,8 @@
 import { useQuery } from "react-query";
 
+const baseUrl = "http://127.0.0.1:8000";
+
 const api = (token) => {
-    const baseUrl = "http://127.0.0.1:8000";
 
     const headers = {
         "Content-Type": "application/json",
@@ -61,7 +62,14 @@ const api = (token) => {
         )
     );
 
-    return { get, post, postForm, remove, put };
+    const socket = (url) => (
+        new WebSocket(
+            baseUrl.replace(/^http/, "ws") + url
+                + "?token=" + encodeURIComponent(token),
+        )
+    );
+
+    return { get, post, postForm, remove, put, socket };
 };
 
 export default api;
\ No newline at end of file
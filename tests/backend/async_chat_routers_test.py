@@ -0,0 +1,119 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import Session, SQLModel, select
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from backend import async_database as adb
+from backend import auth
+from backend import database as db
+from backend.entities import ChatInDB, MessageInDB, UserChatLinkInDB, UserInDB
+from backend.routers.async_chat_routers import async_chats_router
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = tmp_path / "async.db"
+    engine = db.build_engine(f"sqlite:///{path}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(UserInDB(id=1, username="bishop", email="testemail",
+                             hashed_password="x"))
+        session.add(ChatInDB(id=1, name="chat", owner_id=1))
+        session.add(UserChatLinkInDB(user_id=1, chat_id=1))
+        session.add(MessageInDB(id=1, text="hello", user_id=1, chat_id=1))
+        session.commit()
+    return path
+
+@pytest.fixture
+def async_client(database_path):
+    # built the way backend.async_database builds its engine
+    engine = db.build_engine(f"sqlite+aiosqlite:///{database_path}",
+                             create=create_async_engine)
+
+    async def _get_async_session_override():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    app = FastAPI()
+    app.include_router(async_chats_router)
+    app.dependency_overrides[adb.get_async_session] = _get_async_session_override
+    app.dependency_overrides[auth.get_current_user_async] = lambda: UserInDB(id=1)
+
+    with TestClient(app) as client:
+        yield client
+
+def test_async_get_chat_messages(async_client):
+    response = async_client.get("/chats/1/messages")
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 1}
+    message = response.json()["messages"][0]
+    assert message["text"] == "hello"
+    assert message["user"]["username"] == "bishop"
+
+def test_async_create_update_delete_message(async_client):
+    response = async_client.post("/chats/1/messages", json={"text": "new"})
+    assert response.status_code == 201
+    message = response.json()["message"]
+    assert message["text"] == "new"
+
+    response = async_client.put(f"/chats/1/messages/{message['id']}",
+                                json={"text": "edited"})
+    assert response.status_code == 200
+    assert response.json()["message"]["text"] == "edited"
+
+    response = async_client.delete(f"/chats/1/messages/{message['id']}")
+    assert response.status_code == 204
+
+    response = async_client.get("/chats/1/messages")
+    assert [m["id"] for m in response.json()["messages"]] == [1]
+
+def test_async_get_chats_recent(async_client):
+    response = async_client.get("/chats", params={"order": "recent"})
+    assert response.status_code == 200
+    chat = response.json()["chats"][0]
+    assert chat["last_message"]["text"] == "hello"
+    assert chat["owner"]["username"] == "bishop"
+
+def test_async_get_chats_etag(async_client):
+    response = async_client.get("/chats")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = async_client.get("/chats", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    async_client.post("/chats/1/messages", json={"text": "new"})
+    response = async_client.get("/chats", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_async_current_user_from_token(async_client):
+    del async_client.app.dependency_overrides[auth.get_current_user_async]
+    token = auth._build_access_token(UserInDB(id=1)).access_token
+
+    response = async_client.get("/chats", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert [chat["name"] for chat in response.json()["chats"]] == ["chat"]
+    assert auth.principal_cache.get(token)[1].username == "bishop"
+
+    response = async_client.get("/chats", headers={"Authorization": "Bearer nonsense"})
+    assert response.status_code == 401
+
+def test_build_async_engine_with_default_pool(database_path):
+    url = f"sqlite+aiosqlite:///{database_path}"
+    engine = db.build_engine(url, create=create_async_engine)
+
+    async def _count_messages():
+        async with AsyncSession(engine) as session:
+            return (await session.exec(select(func.count(MessageInDB.id)))).one()
+
+    assert asyncio.run(_count_messages()) == 1
+    assert isinstance(engine.pool, AsyncAdaptedQueuePool)
+    assert engine.pool.size() == db.database_pool_size
+    assert engine.pool._max_overflow == db.database_max_overflow
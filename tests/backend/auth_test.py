@@ -0,0 +1,92 @@
+import threading
+import pytest
+from passlib.context import CryptContext
+from backend import passwords
+from backend.entities import UserInDB
+
+def test_login_rehashes_outdated_password(client, session):
+    old_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+    user = UserInDB(username="bishop", email="testemail",
+                    hashed_password=old_context.hash("secret"))
+    session.add(user)
+    session.commit()
+
+    response = client.post("/auth/token",
+                           data={"username": "bishop", "password": "secret"})
+    assert response.status_code == 200
+
+    session.refresh(user)
+    assert passwords.pwd_context.identify(user.hashed_password) == "bcrypt"
+    assert not passwords.pwd_context.needs_update(user.hashed_password)
+    assert passwords.pwd_context.verify("secret", user.hashed_password)
+
+def test_login_wrong_password(client, user_fixture):
+    user_fixture(username="bishop", email="testemail", password="secret")
+    response = client.post("/auth/token",
+                           data={"username": "bishop", "password": "wrong"})
+    assert response.status_code == 401
+
+def test_login_hasher_saturated(client, user_fixture, monkeypatch):
+    user_fixture(username="bishop", email="testemail", password="secret")
+    monkeypatch.setattr(passwords, "_pending", threading.BoundedSemaphore(1))
+    passwords._pending.acquire()
+
+    response = client.post("/auth/token",
+                           data={"username": "bishop", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+def test_failed_submit_releases_permit(monkeypatch):
+    class BrokenPool:
+        def submit(self, fn, *args):
+            raise RuntimeError("cannot schedule new futures after shutdown")
+
+    monkeypatch.setattr(passwords, "hash_workers", 1)
+    monkeypatch.setattr(passwords, "_pool", BrokenPool())
+    monkeypatch.setattr(passwords, "_pending", threading.BoundedSemaphore(1))
+
+    with pytest.raises(RuntimeError):
+        passwords.hash_password("secret")
+    assert passwords._pending.acquire(blocking=False)
+
+def test_register_new_user(client):
+    response = client.post("/auth/registration", json={
+        "username": "bishop", "email": "testemail", "password": "secret",
+    })
+    assert response.status_code == 201
+    assert response.json()["user"]["username"] == "bishop"
+
+    response = client.post("/auth/token",
+                           data={"username": "bishop", "password": "secret"})
+    assert response.status_code == 200
+
+    response = client.post("/auth/registration", json={
+        "username": "bishop", "email": "other", "password": "secret",
+    })
+    assert response.status_code == 422
+    assert response.json()["detail"]["entity_field"] == "username"
+
+def test_hashing_does_not_hold_a_connection(client, session, user_fixture, monkeypatch):
+    user_fixture(username="bishop", email="testemail", password="secret")
+    in_transaction = []
+    verify_password, hash_password_async = passwords.verify_password, passwords.hash_password_async
+
+    async def _verify(*args):
+        in_transaction.append(session.in_transaction())
+        return await verify_password(*args)
+
+    async def _hash(*args):
+        in_transaction.append(session.in_transaction())
+        return await hash_password_async(*args)
+
+    monkeypatch.setattr(passwords, "verify_password", _verify)
+    monkeypatch.setattr(passwords, "hash_password_async", _hash)
+
+    response = client.post("/auth/token",
+                           data={"username": "bishop", "password": "secret"})
+    assert response.status_code == 200
+    response = client.post("/auth/registration", json={
+        "username": "ripley", "email": "ripley@email", "password": "secret",
+    })
+    assert response.status_code == 201
+    assert in_transaction == [False, False]
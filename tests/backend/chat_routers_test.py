@@ -1,7 +1,19 @@
+import json
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import select
+from starlette.websockets import WebSocketDisconnect
 from backend.main import app
 import pytest
-from backend.entities import ChatInDB, UserChatLinkInDB, MessageInDB
+from backend import auth
+from backend import database as db
+from backend import migrations
+from backend import serialization
+from backend.routers import chat_routers
+from backend.entities import (
+    ChatInDB, ChatUpdate, UserChatLinkInDB, MessageInDB, MessageUpdate, UserUpdate,
+)
 
 @pytest.fixture
 def default_chats():
@@ -192,4 +204,460 @@ def test_get_chat_users_invalid_id(client):
             "entity_name": "Chat",
             "entity_id": str(chat_id),
         },
-    }
\ No newline at end of file
+    }
+
+def test_get_chat_messages_paginated(client_as, session, user_fixture,
+                                     member_chat_fixture, message_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    start = datetime(2024, 1, 1)
+    messages = [
+        message_fixture(chat.id, user.id, text=f"message {i}",
+                        created_at=start + timedelta(minutes=i))
+        for i in range(5)
+    ]
+    client = client_as(user)
+
+    # without a cursor the most recent page is returned
+    response = client.get(f"/chats/{chat.id}/messages", params={"limit": 2})
+    assert response.status_code == 200
+    page = response.json()
+    assert [m["id"] for m in page["messages"]] == [m.id for m in messages[3:]]
+    assert page["meta"]["count"] == 2
+    assert "next" not in page["meta"]
+
+    response = client.get(f"/chats/{chat.id}/messages",
+                          params={"limit": 2, "before": page["meta"]["prev"]})
+    page = response.json()
+    assert [m["id"] for m in page["messages"]] == [m.id for m in messages[1:3]]
+
+    response = client.get(f"/chats/{chat.id}/messages",
+                          params={"limit": 2, "before": page["meta"]["prev"]})
+    page = response.json()
+    assert [m["id"] for m in page["messages"]] == [messages[0].id]
+    assert "prev" not in page["meta"]
+
+    response = client.get(f"/chats/{chat.id}/messages",
+                          params={"limit": 3, "after": page["meta"]["next"]})
+    page = response.json()
+    assert [m["id"] for m in page["messages"]] == [m.id for m in messages[1:4]]
+    assert page["meta"]["next"] is not None
+
+def test_get_chat_messages_invalid_cursor(client_as, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+
+    response = client_as(user).get(f"/chats/{chat.id}/messages",
+                                   params={"before": "not a cursor"})
+    assert response.status_code == 422
+    assert response.json()["detail"]["type"] == "invalid_cursor"
+
+def test_chat_events_websocket(client, session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    token = auth._build_access_token(user).access_token
+
+    with client.websocket_connect(f"/chats/{chat.id}/ws?token={token}") as websocket:
+        message = db.create_message(session, chat.id, user.id, "hello")
+        event = websocket.receive_json()
+        assert event["type"] == "message_created"
+        assert event["message"]["id"] == message.id
+        assert event["message"]["text"] == "hello"
+
+        db.update_message(session, chat.id, message.id,
+                          MessageUpdate(text="edited"), user.id)
+        event = websocket.receive_json()
+        assert event["type"] == "message_updated"
+        assert event["message"]["text"] == "edited"
+
+        db.delete_message(session, chat.id, message.id, user.id)
+        assert websocket.receive_json() == {
+            "type": "message_deleted",
+            "chat_id": chat.id,
+            "message_id": message.id,
+        }
+
+def test_chat_events_websocket_requires_membership(client, user_fixture, chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = chat_fixture(owner_id=user.id)
+    token = auth._build_access_token(user).access_token
+
+    with pytest.raises(WebSocketDisconnect) as error:
+        with client.websocket_connect(f"/chats/{chat.id}/ws?token={token}"):
+            pass
+    assert error.value.code == 1008
+
+def test_get_chat_messages_not_a_member(client_as, user_fixture, chat_fixture):
+    owner = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="rook", email="rookemail").user
+    chat = chat_fixture(owner_id=owner.id)
+
+    response = client_as(other).get(f"/chats/{chat.id}/messages")
+    assert response.status_code == 403
+    assert response.json()["detail"]["error"] == "no_permission"
+
+def test_update_message_in_other_chat(client_as, user_fixture,
+                                      member_chat_fixture, message_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user, name="first")
+    other_chat = member_chat_fixture(user, name="second")
+    message = message_fixture(other_chat.id, user.id)
+
+    response = client_as(user).put(f"/chats/{chat.id}/messages/{message.id}",
+                                   json={"text": "edited"})
+    assert response.status_code == 404
+    assert response.json()["detail"]["entity_name"] == "Message"
+
+    response = client_as(user).put(f"/chats/{other_chat.id}/messages/{message.id}",
+                                   json={"text": "edited"})
+    assert response.status_code == 200
+    assert response.json()["message"]["text"] == "edited"
+
+def test_get_chat_users_paginated(client_as, session, user_fixture, member_chat_fixture):
+    users = [
+        user_fixture(username=name, email=f"{name}@email.com").user
+        for name in ["bishop", "rook", "pawn"]
+    ]
+    chat = member_chat_fixture(users[0])
+    for user in users[1:]:
+        session.add(UserChatLinkInDB(user_id=user.id, chat_id=chat.id))
+    session.commit()
+
+    response = client_as(users[0]).get(f"/chats/{chat.id}/users",
+                                       params={"limit": 2, "offset": 1})
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 2}
+    assert [user["id"] for user in response.json()["users"]] == [users[1].id, users[2].id]
+
+def test_chat_endpoints_query_count(client_as, session, user_fixture, member_chat_fixture,
+                                    message_fixture, assert_max_queries):
+    users = [
+        user_fixture(username=name, email=f"{name}@email.com").user
+        for name in ["bishop", "rook", "pawn"]
+    ]
+    chat = member_chat_fixture(users[0])
+    for user in users[1:]:
+        session.add(UserChatLinkInDB(user_id=user.id, chat_id=chat.id))
+    session.commit()
+    chat_id = chat.id
+    for i in range(30):
+        message_fixture(chat_id, users[i % 3].id, text=f"message {i}")
+    session.expunge_all()
+    client = client_as(users[0])
+
+    with assert_max_queries(3):
+        response = client.get(f"/chats/{chat_id}/messages")
+    assert len(response.json()["messages"]) == 30
+
+    session.expunge_all()
+    with assert_max_queries(2):
+        response = client.get("/chats")
+    assert response.json()["meta"]["count"] == 1
+
+    session.expunge_all()
+    with assert_max_queries(6):
+        response = client.get(f"/chats/{chat_id}", params={"include": ["messages", "users"]})
+    assert len(response.json()["messages"]) == 30
+
+def test_search_messages(client_as, session, user_fixture, member_chat_fixture,
+                         chat_fixture, message_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user, name="first")
+    other_chat = member_chat_fixture(user, name="second")
+    hidden_chat = chat_fixture(name="hidden", owner_id=user.id)
+    first = message_fixture(chat.id, user.id, text="the pony express rides")
+    second = message_fixture(other_chat.id, user.id, text="a pony")
+    message_fixture(hidden_chat.id, user.id, text="pony outside the users chats")
+    message_fixture(chat.id, user.id, text="unrelated")
+    client = client_as(user)
+
+    response = client.get("/chats/search", params={"q": "pony"})
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 2}
+    assert {m["id"] for m in response.json()["messages"]} == {first.id, second.id}
+
+    response = client.get(f"/chats/{chat.id}/search", params={"q": 'pony "express'})
+    assert [m["id"] for m in response.json()["messages"]] == [first.id]
+
+    db.update_message(session, chat.id, first.id, MessageUpdate(text="edited"), user.id)
+    response = client.get(f"/chats/{chat.id}/search", params={"q": "pony"})
+    assert response.json()["messages"] == []
+
+def test_get_chat_counters(client_as, session, user_fixture, member_chat_fixture,
+                           message_fixture, assert_max_queries):
+    user = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="rook", email="rookemail").user
+    chat = member_chat_fixture(user)
+    session.add(UserChatLinkInDB(user_id=other.id, chat_id=chat.id))
+    session.commit()
+    first_at = db.create_message(session, chat.id, user.id, "first").created_at
+    last = db.create_message(session, chat.id, other.id, "last")
+    last_id, last_at, chat_id = last.id, last.created_at, chat.id
+    client = client_as(user)
+
+    session.expunge_all()
+    with assert_max_queries(2):
+        response = client.get(f"/chats/{chat_id}")
+    assert response.json()["meta"] == {
+        "message_count": 2,
+        "user_count": 2,
+        "last_message_at": last_at.isoformat(),
+    }
+
+    db.delete_message(session, chat_id, last_id, other.id)
+    response = client.get(f"/chats/{chat_id}")
+    assert response.json()["meta"] == {
+        "message_count": 1,
+        "user_count": 2,
+        "last_message_at": first_at.isoformat(),
+    }
+
+def test_reconcile_chat_counters(session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    session.connection().execute(MessageInDB.__table__.insert(), [
+        {"text": "bulk", "user_id": user.id, "chat_id": chat.id,
+         "created_at": datetime(2024, 1, 1)},
+    ])
+    session.commit()
+    assert chat.message_count == 0
+
+    migrations.reconcile_chat_counters(session.connection())
+    session.commit()
+    assert (chat.message_count, chat.user_count) == (1, 1)
+    assert chat.last_message_at == datetime(2024, 1, 1)
+
+def test_conditional_get_chat_messages(client_as, session, user_fixture,
+                                       member_chat_fixture, assert_max_queries):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    chat_id = chat.id
+    db.create_message(session, chat_id, user.id, "hello")
+    client = client_as(user)
+
+    response = client.get(f"/chats/{chat_id}/messages")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    session.expunge_all()
+    with assert_max_queries(2):
+        response = client.get(f"/chats/{chat_id}/messages",
+                              headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    response = client.get(f"/chats/{chat_id}/messages", params={"limit": 1},
+                          headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+    db.create_message(session, chat_id, user.id, "again")
+    response = client.get(f"/chats/{chat_id}/messages", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert len(response.json()["messages"]) == 2
+    etag = response.headers["etag"]
+
+    db.update_user(session, user.id, UserUpdate(username="rook"))
+    response = client.get(f"/chats/{chat_id}/messages", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["messages"][0]["user"]["username"] == "rook"
+
+def test_conditional_get_chats(client_as, session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    client = client_as(user)
+
+    etag = client.get("/chats").headers["etag"]
+    assert client.get("/chats", headers={"If-None-Match": etag}).status_code == 304
+
+    db.update_chat(session, chat.id, user.id, ChatUpdate(name="renamed"))
+    response = client.get("/chats", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["chats"][0]["name"] == "renamed"
+
+def test_get_chat_messages_fast_json(client_as, session, user_fixture,
+                                     member_chat_fixture, message_fixture, monkeypatch):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    start = datetime(2024, 1, 1, 12, 30, 15, 250)
+    for i in range(3):
+        message_fixture(chat.id, user.id, text=f"message {i}",
+                        created_at=start + timedelta(seconds=i))
+    client = client_as(user)
+
+    expected = client.get(f"/chats/{chat.id}/messages", params={"limit": 2})
+    monkeypatch.setattr(serialization, "fast_json", True)
+    response = client.get(f"/chats/{chat.id}/messages", params={"limit": 2})
+
+    assert response.status_code == 200
+    assert response.json() == expected.json()
+    assert response.headers["etag"] == expected.headers["etag"]
+
+def test_export_chat_messages(client_as, session, user_fixture,
+                              member_chat_fixture, message_fixture, monkeypatch):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    other_chat = member_chat_fixture(user, name="other")
+    start = datetime(2024, 1, 1, 12, 30, 15, 250)
+    message_ids = [
+        message_fixture(chat.id, user.id, text=f"message {i}",
+                        created_at=start + timedelta(seconds=i)).id
+        for i in range(5)
+    ]
+    message_fixture(other_chat.id, user.id, text="elsewhere")
+    # several batches per export
+    monkeypatch.setattr(chat_routers, "export_batch_size", 2)
+    client = client_as(user)
+
+    response = client.get(f"/chats/{chat.id}/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == message_ids
+    cursors = [line.pop("cursor") for line in lines]
+    assert lines[0] == client.get(f"/chats/{chat.id}/messages").json()["messages"][0]
+
+    # resumes after the cursor, even once its message is gone
+    db.delete_message(session, chat.id, message_ids[2], user.id)
+    response = client.get(f"/chats/{chat.id}/export", params={"after": cursors[2]})
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == message_ids[3:]
+
+    response = client.get(f"/chats/{chat.id}/export", params={"after": "nonsense"})
+    assert response.status_code == 422
+
+def test_export_chat_messages_checks_access(client_as, user_fixture, member_chat_fixture):
+    owner = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="ripley", email="ripley@email").user
+    chat = member_chat_fixture(owner)
+
+    response = client_as(other).get(f"/chats/{chat.id}/export")
+
+    assert response.status_code == 403
+
+def test_create_messages_batch(client_as, session, user_fixture, member_chat_fixture,
+                               assert_max_queries):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    chat_id = chat.id
+    client = client_as(user)
+    texts = [f"relayed {i}" for i in range(20)]
+
+    # one INSERT per message, plus a constant number of statements
+    with assert_max_queries(len(texts) + 5):
+        response = client.post(f"/chats/{chat_id}/messages:batch",
+                               json={"messages": [{"text": text} for text in texts]})
+
+    assert response.status_code == 201
+    body = response.json()
+    assert body["meta"] == {"count": 20}
+    assert [message["text"] for message in body["messages"]] == texts
+    assert all(message["user"]["id"] == user.id for message in body["messages"])
+    listed = client.get(f"/chats/{chat_id}/messages").json()["messages"]
+    assert [message["id"] for message in listed] == [message["id"] for message in body["messages"]]
+    assert client.get(f"/chats/{chat_id}").json()["meta"]["message_count"] == 20
+
+def test_create_messages_batch_all_or_nothing(client_as, session, user_fixture,
+                                              member_chat_fixture, monkeypatch):
+    user = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="ripley", email="ripley@email").user
+    chat = member_chat_fixture(user)
+    chat_id = chat.id
+    monkeypatch.setattr(db, "message_batch_max", 3)
+
+    too_many = client_as(user).post(f"/chats/{chat_id}/messages:batch",
+                                    json={"messages": [{"text": "x"}] * 4})
+    not_member = client_as(other).post(f"/chats/{chat_id}/messages:batch",
+                                       json={"messages": [{"text": "x"}]})
+    empty = client_as(user).post(f"/chats/{chat_id}/messages:batch",
+                                 json={"messages": []})
+
+    assert too_many.status_code == 422
+    assert too_many.json()["detail"] == {"type": "batch_too_large", "size": 4, "limit": 3}
+    assert not_member.status_code == 403
+    assert empty.status_code == 422
+    assert client_as(user).get(f"/chats/{chat_id}/messages").json()["messages"] == []
+
+def test_create_messages_batch_insert_fails_midway(client_as, session, user_fixture,
+                                                  member_chat_fixture, monkeypatch):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    chat_id = chat.id
+    published = []
+    monkeypatch.setattr(db.events.hub, "publish",
+                        lambda chat_id, event: published.append(event))
+    inserts = []
+
+    def _fail_third_insert(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO messages "):
+            inserts.append(statement)
+            if len(inserts) == 3:
+                raise RuntimeError("disk full")
+
+    event.listen(session.get_bind(), "before_cursor_execute", _fail_third_insert)
+    try:
+        with pytest.raises(RuntimeError):
+            client_as(user).post(f"/chats/{chat_id}/messages:batch",
+                                 json={"messages": [{"text": f"relayed {i}"} for i in range(5)]})
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", _fail_third_insert)
+    # the app closes its session after a request, the shared test session
+    # has to be rolled back by hand
+    session.rollback()
+
+    assert len(inserts) == 3
+    assert published == []
+    assert session.exec(select(MessageInDB).where(MessageInDB.chat_id == chat_id)).all() == []
+    assert session.get(ChatInDB, chat_id).message_count == 0
+
+def test_get_chats_recent(client_as, session, user_fixture, member_chat_fixture,
+                          message_fixture, assert_max_queries):
+    user = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="ripley", email="ripley@email").user
+    quiet = member_chat_fixture(user, name="a quiet chat")
+    older = member_chat_fixture(user, name="b older")
+    newer = member_chat_fixture(user, name="c newer")
+    member_chat_fixture(other, name="not mine")
+    chat_ids = {"quiet": quiet.id, "older": older.id, "newer": newer.id}
+    start = datetime(2024, 1, 1, 12)
+    message_fixture(chat_ids["older"], user.id, text="first", created_at=start)
+    message_fixture(chat_ids["newer"], user.id, text="second",
+                    created_at=start + timedelta(minutes=1))
+    latest = message_fixture(chat_ids["older"], user.id, text="latest",
+                             created_at=start + timedelta(minutes=2))
+    latest_id = latest.id
+    client = client_as(user)
+
+    with assert_max_queries(2):
+        response = client.get("/chats", params={"order": "recent", "limit": 2})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [chat["id"] for chat in body["chats"]] == [chat_ids["older"], chat_ids["newer"]]
+    assert body["chats"][0]["last_message"] == {
+        "id": latest_id,
+        "text": "latest",
+        "user_id": user.id,
+        "created_at": "2024-01-01T12:02:00",
+    }
+    assert body["chats"][0]["owner"]["id"] == user.id
+    assert body["meta"]["count"] == 2
+
+    rest = client.get("/chats", params={"order": "recent", "after": body["meta"]["next"]}).json()
+    assert [chat["id"] for chat in rest["chats"]] == [chat_ids["quiet"]]
+    assert "last_message" not in rest["chats"][0]
+    assert "next" not in rest["meta"]
+
+    # deleting the latest message falls back to the one before it
+    client.delete(f"/chats/{chat_ids['older']}/messages/{latest_id}")
+    body = client.get("/chats", params={"order": "recent"}).json()
+    assert [chat["id"] for chat in body["chats"]] == [
+        chat_ids["newer"], chat_ids["older"], chat_ids["quiet"],
+    ]
+    assert body["chats"][1]["last_message"]["text"] == "first"
+
+def test_get_chats_recent_invalid_cursor(client_as, user_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+
+    response = client_as(user).get("/chats", params={"order": "recent", "after": "nope"})
+
+    assert response.status_code == 422
@@ -0,0 +1,56 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from backend.compression import CompressionMiddleware, choose_encoding
+
+def test_choose_encoding():
+    available = ["zstd", "br", "gzip"]
+    assert choose_encoding("gzip, deflate, br", available) == "br"
+    assert choose_encoding("gzip;q=1.0, br;q=0.5", available) == "gzip"
+    assert choose_encoding("br;q=0, gzip", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("identity", available) is None
+    assert choose_encoding("", available) is None
+
+def test_users_listing_compressed(client, user_fixture):
+    for i in range(20):
+        user_fixture(username=f"user{i}", email=f"user{i}@email.com")
+
+    response = client.get("/users", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json()["meta"]["count"] == 20
+
+def test_small_response_not_compressed(client):
+    response = client.get("/users", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+def test_streaming_response_compressed_per_chunk():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=10)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (f"line {i}\n".encode() for i in range(100)),
+            media_type="application/x-ndjson",
+        )
+
+    @app.get("/image")
+    def image():
+        return PlainTextResponse("x" * 100, media_type="image/png")
+
+    client = TestClient(app)
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        raw = b"".join(response.iter_raw())
+    assert gzip.decompress(raw).decode() == "".join(f"line {i}\n" for i in range(100))
+
+    response = client.get("/image", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,18 @@
+from sqlalchemy.pool import QueuePool, SingletonThreadPool
+from backend import database as db
+
+
+def test_build_engine_applies_pragmas(tmp_path):
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'pragmas.db'}")
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+        assert connection.exec_driver_sql("PRAGMA synchronous").scalar() == 1
+
+
+def test_build_engine_sizes_queue_pools_only(tmp_path):
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    assert isinstance(engine.pool, QueuePool)
+    assert engine.pool.size() == db.database_pool_size
+
+    assert isinstance(db.build_engine("sqlite://").pool, SingletonThreadPool)
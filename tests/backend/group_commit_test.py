@@ -0,0 +1,95 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from sqlalchemy import event
+from backend import database as db
+from backend import query_stats
+from backend.group_commit import GroupCommitWriter
+
+@pytest.fixture
+def writer(session):
+    writer = GroupCommitWriter(session.get_bind(), window=0.05, max_batch=50)
+    yield writer
+    writer.close()
+
+def test_concurrent_messages_share_commits(session, writer, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat_id = member_chat_fixture(user).id
+    commits = []
+    event.listen(session.get_bind(), "commit", lambda conn: commits.append(1))
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        futures = [pool.submit(writer.create_message, chat_id, user.id, f"post {i}")
+                   for i in range(40)]
+        messages = [future.result(timeout=10) for future in futures]
+
+    assert sorted(message.text for message in messages) == sorted(f"post {i}" for i in range(40))
+    assert all(message.user.id == user.id for message in messages)
+    assert len(commits) < 40
+    assert len(db.get_chat_messages(session, chat_id, user.id).messages) == 40
+
+def test_errors_are_reported_per_message(session, writer, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    other = user_fixture(username="ripley", email="ripley@email").user
+    chat_id = member_chat_fixture(user).id
+
+    ok = writer.submit(chat_id, user.id, "first")
+    forbidden = writer.submit(chat_id, other.id, "not a member")
+    broken = writer.submit(chat_id, user.id, None)
+    also_ok = writer.submit(chat_id, user.id, "second")
+
+    assert ok.result(timeout=10).text == "first"
+    assert also_ok.result(timeout=10).text == "second"
+    assert forbidden.exception(timeout=10).status_code == 403
+    assert broken.exception(timeout=10) is not None
+    texts = [message.text for message in db.get_chat_messages(session, chat_id, user.id).messages]
+    assert texts == ["first", "second"]
+
+def test_publish_failure_still_returns_committed_messages(session, writer, user_fixture,
+                                                         member_chat_fixture, monkeypatch):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat_id = member_chat_fixture(user).id
+
+    def _publish_fails(message):
+        raise RuntimeError("hub is down")
+
+    monkeypatch.setattr(db, "publish_message_created", _publish_fails)
+    futures = [writer.submit(chat_id, user.id, f"post {i}") for i in range(3)]
+
+    assert [future.result(timeout=10).text for future in futures] == ["post 0", "post 1", "post 2"]
+    assert len(db.get_chat_messages(session, chat_id, user.id).messages) == 3
+
+def test_writer_queries_are_charged_to_the_request(session, writer, user_fixture,
+                                                   member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat_id = member_chat_fixture(user).id
+
+    def _request():
+        stats = query_stats.start({"path": "/chats/{chat_id}/messages"})
+        writer.create_message(chat_id, user.id, "counted")
+        return stats
+
+    stats = contextvars.copy_context().run(_request)
+
+    assert stats.count > 0
+    assert stats.duration > 0
+
+def test_batch_queries_are_shared_between_requests(session, writer, user_fixture,
+                                                   member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat_id = member_chat_fixture(user).id
+    statements = []
+    event.listen(session.get_bind(), "after_cursor_execute",
+                 lambda *args: statements.append(args[2]))
+
+    def _request(i):
+        stats = query_stats.start({"path": "/chats/{chat_id}/messages"})
+        return stats, writer.submit(chat_id, user.id, f"post {i}")
+
+    requests = [contextvars.copy_context().run(_request, i) for i in range(7)]
+    for _stats, future in requests:
+        future.result(timeout=10)
+
+    assert writer.batches == 1
+    assert sum(stats.count for stats, _future in requests) == len(statements)
+    assert max(stats.count for stats, _future in requests) < len(statements)
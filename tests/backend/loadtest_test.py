@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+from passlib.context import CryptContext
+from sqlmodel import Session
+from backend import database as db
+from backend import seed
+from backend.main import app
+from benchmarks import loadtest
+
+def test_loadtest_smoke(tmp_path, monkeypatch):
+    # cheap hashes, logins upgrade them on the hashing pool
+    fast_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+    monkeypatch.setattr(seed.passwords, "hash_password", fast_context.hash)
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'loadtest.db'}")
+    db.create_db_and_tables(engine)
+    seed.load(engine, seed.generate(engine, users=5, chats=2, members=3, messages=50,
+                                    password=loadtest.password))
+
+    def _get_session_override():
+        with Session(engine) as session:
+            yield session
+
+    app.dependency_overrides[db.get_session] = _get_session_override
+    args = argparse.Namespace(profile="mixed", mix=None, concurrency=4, duration=2,
+                              users=5, seed=0)
+
+    async def _run():
+        async with loadtest.in_process_client(app) as client:
+            return await loadtest.run(client, args)
+
+    try:
+        stats, elapsed = asyncio.run(_run())
+    finally:
+        app.dependency_overrides.clear()
+
+    assert stats.failed_starts == 0
+    assert elapsed >= 2
+    assert sum(map(len, stats.latencies.values())) > 0
+    assert set(stats.latencies) <= {
+        "POST /auth/token", "GET /chats", "GET /chats/{chat_id}/messages",
+        "POST /chats/{chat_id}/messages", "PUT /chats/{chat_id}/messages/{message_id}",
+    }
+
+def test_loadtest_counts_failures_instead_of_stopping():
+    def _broken_session():
+        raise RuntimeError("database is gone")
+
+    app.dependency_overrides[db.get_session] = _broken_session
+    args = argparse.Namespace(profile="read-heavy", mix=None, concurrency=2, duration=0.5,
+                              users=5, seed=0)
+
+    async def _run():
+        async with loadtest.in_process_client(app) as client:
+            return await loadtest.run(client, args)
+
+    try:
+        stats, _elapsed = asyncio.run(_run())
+    finally:
+        app.dependency_overrides.clear()
+
+    # every request is a 500, counted rather than ending the run
+    assert stats.failed_starts == 2
+    assert stats.errors["GET /chats"] > 0
@@ -0,0 +1,65 @@
+import logging
+
+from backend import query_stats
+from backend.metrics import Histogram
+from backend.query_stats import RequestQueryStats
+
+def test_metrics_per_route_template(client, user_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    client.get(f"/users/{user.id}")
+    client.get("/users/12345")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/users/{user_id}",status="200"}' in body
+    assert 'http_requests_total{method="GET",route="/users/{user_id}",status="404"}' in body
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/{user_id}"}' in body
+    assert "http_requests_in_flight " in body
+    assert "threadpool_threads_total " in body
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "test", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value, "/x")
+
+    assert list(histogram.render())[2:] == [
+        'latency_bucket{route="/x",le="0.1"} 2',
+        'latency_bucket{route="/x",le="1"} 3',
+        'latency_bucket{route="/x",le="+Inf"} 4',
+        'latency_sum{route="/x"} 5.65',
+        'latency_count{route="/x"} 4',
+    ]
+
+def test_server_timing_reports_queries(client, session, user_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    # otherwise the lookup may be answered from the session's identity map
+    session.expunge_all()
+    response = client.get(f"/users/{user.id}")
+
+    assert response.status_code == 200
+    db_timing = response.headers["server-timing"]
+    assert db_timing.startswith("db;dur=")
+    assert 'desc="1 query"' in db_timing
+
+    metrics = client.get("/metrics").text
+    assert 'http_request_db_queries_count{method="GET",route="/users/{user_id}"}' in metrics
+    assert 'http_request_db_seconds_total{method="GET",route="/users/{user_id}"}' in metrics
+
+def test_slow_queries_are_logged_with_route(client, session, user_fixture, monkeypatch, caplog):
+    user = user_fixture(username="bishop", email="testemail").user
+    session.expunge_all()
+    monkeypatch.setattr(query_stats, "slow_query_threshold", 0)
+
+    with caplog.at_level(logging.WARNING, logger="backend.sql"):
+        client.get(f"/users/{user.id}")
+
+    assert any(
+        "on /users/{user_id}: SELECT" in record.getMessage() for record in caplog.records
+    )
+
+def test_server_timing_pluralizes_queries():
+    assert RequestQueryStats(count=1).server_timing() == 'db;dur=0.0;desc="1 query"'
+    assert RequestQueryStats(count=0).server_timing() == 'db;dur=0.0;desc="0 queries"'
+    assert RequestQueryStats(count=3).server_timing() == 'db;dur=0.0;desc="3 queries"'
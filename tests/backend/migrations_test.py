@@ -0,0 +1,50 @@
+from sqlalchemy import inspect
+from sqlmodel import Session, SQLModel
+from backend import database as db
+from backend import migrations
+from backend.entities import ChatInDB, MessageInDB, UserInDB
+
+def test_migrate_adds_indexes_to_existing_tables(tmp_path):
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_messages_chat_id_created_at_id")
+        connection.exec_driver_sql("DROP INDEX ix_user_chat_links_chat_id_user_id")
+    with Session(engine) as session:
+        session.add(UserInDB(id=1, username="bishop", email="testemail", hashed_password="x"))
+        session.add(ChatInDB(id=1, name="chat", owner_id=1))
+        session.add(MessageInDB(id=1, text="hello", user_id=1, chat_id=1))
+        session.commit()
+
+    migrations.migrate(engine)
+    migrations.migrate(engine)
+
+    inspector = inspect(engine)
+    assert "ix_messages_chat_id_created_at_id" in {
+        index["name"] for index in inspector.get_indexes("messages")
+    }
+    assert "ix_user_chat_links_chat_id_user_id" in {
+        index["name"] for index in inspector.get_indexes("user_chat_links")
+    }
+    with Session(engine) as session:
+        assert session.get(MessageInDB, 1).text == "hello"
+
+def test_migrate_backfills_last_message(tmp_path):
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_chats_last_message_at_id")
+        connection.exec_driver_sql("ALTER TABLE chats DROP COLUMN last_message_id")
+        connection.exec_driver_sql(
+            "INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'bishop', 'e', 'x')"
+        )
+        connection.exec_driver_sql("INSERT INTO chats (id, name, owner_id) VALUES (1, 'chat', 1)")
+        connection.exec_driver_sql(
+            "INSERT INTO messages (id, text, user_id, chat_id, created_at) VALUES "
+            "(1, 'old', 1, 1, '2024-01-01 00:00:00'), (2, 'new', 1, 1, '2024-01-02 00:00:00')"
+        )
+
+    migrations.migrate(engine)
+
+    with Session(engine) as session:
+        assert session.get(ChatInDB, 1).last_message_id == 2
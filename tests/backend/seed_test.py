@@ -0,0 +1,109 @@
+import io
+import json
+from datetime import datetime
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from backend import database as db
+from backend import seed
+from backend.entities import ChatInDB, MessageInDB
+
+def test_load_generated_dataset_with_deferred_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(seed.passwords, "hash_password", lambda password: "hashed")
+    engine = db.build_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    db.create_db_and_tables(engine)
+
+    records = seed.generate(engine, users=20, chats=4, members=5, messages=300)
+    report = seed.load(engine, records, batch_size=64, transaction_rows=100,
+                       defer_indexes=True)
+
+    assert dict(report.rows) == {"user": 20, "chat": 4, "membership": 20, "message": 300}
+    assert "ix_messages_chat_id_created_at_id" in {
+        index["name"] for index in inspect(engine).get_indexes("messages")
+    }
+    with Session(engine) as session:
+        chats = session.exec(select(ChatInDB)).all()
+        assert sum(chat.message_count for chat in chats) == 300
+        assert all(chat.user_count == 5 for chat in chats)
+        assert len(db.search_messages(session, chats[0].owner_id, "message", limit=500)) > 0
+
+def test_load_ndjson(session):
+    lines = [
+        {"type": "user", "id": 1, "username": "bishop", "email": "b@example.com",
+         "hashed_password": "x", "created_at": "2024-01-01T00:00:00"},
+        {"type": "chat", "id": 1, "name": "nostromo", "owner_id": 1},
+        {"type": "membership", "user_id": 1, "chat_id": 1},
+        {"type": "message", "text": "hello", "user_id": 1, "chat_id": 1},
+    ]
+    file = io.StringIO("\n".join(json.dumps(line) for line in lines))
+
+    report = seed.load(session.get_bind(), seed.read_ndjson(file))
+
+    assert sum(report.rows.values()) == 4
+    chat = session.get(ChatInDB, 1)
+    assert (chat.message_count, chat.user_count) == (1, 1)
+
+def test_load_records_with_and_without_optional_keys(session):
+    records = [
+        ("user", {"id": 1, "username": "ripley", "email": "r@example.com",
+                  "hashed_password": "x", "created_at": datetime(2024, 1, 1)}),
+        ("user", {"id": 2, "username": "ash", "email": "a@example.com",
+                  "hashed_password": "x"}),
+        ("chat", {"id": 1, "name": "nostromo", "owner_id": 1}),
+        ("membership", {"user_id": 1, "chat_id": 1}),
+        ("message", {"text": "first", "user_id": 1, "chat_id": 1,
+                     "created_at": datetime(2024, 1, 2)}),
+        ("message", {"text": "second", "user_id": 1, "chat_id": 1}),
+        ("message", {"id": 10, "text": "third", "user_id": 1, "chat_id": 1}),
+    ]
+
+    report = seed.load(session.get_bind(), records)
+
+    assert dict(report.rows) == {"user": 2, "chat": 1, "membership": 1, "message": 3}
+    messages = session.exec(select(MessageInDB).order_by(MessageInDB.text)).all()
+    assert [message.text for message in messages] == ["first", "second", "third"]
+    assert messages[0].created_at == datetime(2024, 1, 2)
+    assert all(message.created_at is not None for message in messages)
+    assert session.get(ChatInDB, 1).message_count == 3
+
+def test_failed_deferred_load_restores_search(session):
+    records = [
+        ("user", {"id": 1, "username": "ripley", "email": "r@example.com",
+                  "hashed_password": "x"}),
+        ("chat", {"id": 1, "name": "nostromo", "owner_id": 1}),
+        ("membership", {"user_id": 1, "chat_id": 1}),
+        ("message", {"text": "mother", "user_id": 1, "chat_id": 1}),
+        ("message", {"text": "broken", "user_id": 1}),
+    ]
+    engine = session.get_bind()
+
+    with pytest.raises(IntegrityError):
+        seed.load(engine, records, transaction_rows=4, defer_indexes=True)
+
+    assert "ix_messages_chat_id_created_at_id" in {
+        index["name"] for index in inspect(engine).get_indexes("messages")
+    }
+    assert [message.text for message in db.search_messages(session, 1, "mother")] == ["mother"]
+
+def test_load_into_existing_chat_changes_its_etag(client_as, session, user_fixture,
+                                                  member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    quiet = member_chat_fixture(user, name="quiet")
+    chat_id, quiet_version = chat.id, quiet.version
+    client = client_as(user)
+    etag = client.get("/chats").headers["etag"]
+    chat_etag = client.get(f"/chats/{chat_id}").headers["etag"]
+
+    seed.load(session.get_bind(), [
+        ("message", {"text": f"imported {i}", "user_id": user.id, "chat_id": chat_id})
+        for i in range(3)
+    ])
+    session.expire_all()
+
+    assert client.get("/chats").headers["etag"] != etag
+    response = client.get(f"/chats/{chat_id}", headers={"If-None-Match": chat_etag})
+    assert response.status_code == 200
+    assert response.json()["meta"]["message_count"] == 3
+    assert session.get(ChatInDB, quiet.id).version == quiet_version
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from backend import database as db
+from backend.entities import MessageUpdate, UserChatLinkInDB
+
+def test_sync_changes_since_watermark(client_as, session, user_fixture,
+                                      member_chat_fixture, chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    other_chat = chat_fixture(name="other", owner_id=user.id)
+    kept = db.create_message(session, chat.id, user.id, "kept")
+    client = client_as(user)
+
+    response = client.get("/sync")
+    assert response.status_code == 200
+    start = response.json()
+    assert start["messages"] == [] and start["deleted"] == []
+
+    edited = db.create_message(session, chat.id, user.id, "new")
+    db.update_message(session, chat.id, edited.id, MessageUpdate(text="edited"), user.id)
+    db.delete_message(session, chat.id, kept.id, user.id)
+    # not a member of this chat
+    session.add(UserChatLinkInDB(user_id=user.id, chat_id=other_chat.id))
+    session.commit()
+    hidden = db.create_message(session, other_chat.id, user.id, "joined later")
+    session.delete(session.get(UserChatLinkInDB, (user.id, other_chat.id)))
+    session.commit()
+
+    response = client.get("/sync", params={"since": start["watermark"]})
+    assert response.status_code == 200
+    changes = response.json()
+    assert [(m["id"], m["text"]) for m in changes["messages"]] == [(edited.id, "edited")]
+    assert changes["deleted"] == [{"id": kept.id, "chat_id": chat.id}]
+    assert changes["has_more"] is False
+    assert hidden.id not in [m["id"] for m in changes["messages"]]
+
+    response = client.get("/sync", params={"since": changes["watermark"]})
+    assert response.json()["messages"] == []
+    assert response.json()["watermark"] == changes["watermark"]
+
+def test_sync_paginates(client_as, session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    client = client_as(user)
+    watermark = client.get("/sync").json()["watermark"]
+    for i in range(3):
+        db.create_message(session, chat.id, user.id, f"message {i}")
+
+    texts = []
+    has_more = True
+    while has_more:
+        changes = client.get("/sync", params={"since": watermark, "limit": 2}).json()
+        texts += [m["text"] for m in changes["messages"]]
+        watermark, has_more = changes["watermark"], changes["has_more"]
+    assert texts == ["message 0", "message 1", "message 2"]
+
+def test_sync_invalid_watermark(client_as, user_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    response = client_as(user).get("/sync", params={"since": "nonsense"})
+    assert response.status_code == 422
+
+def test_sync_after_pruning(client_as, session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    client = client_as(user)
+    stale = client.get("/sync").json()["watermark"]
+    for i in range(3):
+        db.create_message(session, chat.id, user.id, f"message {i}")
+    current = client.get("/sync", params={"since": stale}).json()["watermark"]
+    db.create_message(session, chat.id, user.id, "message 3")
+
+    pruned = db.prune_message_changes(session, older_than=datetime.now() + timedelta(days=1))
+
+    # everything but the latest change
+    assert pruned == 3
+    response = client.get("/sync", params={"since": stale})
+    assert response.status_code == 410
+    assert response.json()["detail"]["type"] == "resync_required"
+    response = client.get("/sync", params={"since": current})
+    assert response.status_code == 200
+    assert [m["text"] for m in response.json()["messages"]] == ["message 3"]
+
+def test_prune_keeps_recent_changes(session, user_fixture, member_chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    chat = member_chat_fixture(user)
+    db.create_message(session, chat.id, user.id, "recent")
+    db.create_message(session, chat.id, user.id, "also recent")
+
+    assert db.prune_message_changes(session) == 0
+    assert db.prune_message_changes(session, older_than=datetime.now() - timedelta(days=1)) == 0
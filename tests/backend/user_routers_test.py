@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 from backend.main import app
+from backend.cache import principal_cache
 from backend.entities import UserChatLinkInDB
 
 def test_get_all_users(client, user_fixture):
@@ -88,4 +89,38 @@ def test_get_users_chats_invalid_id(client):
             "entity_name": "User",
             "entity_id": user_id,
         },
-    }
\ No newline at end of file
+    }
+
+def test_get_current_user_cached_until_updated(client, user_fixture):
+    user_fixture(username="bishop", email="testemail", password="secret")
+    token = client.post(
+        "/auth/token", data={"username": "bishop", "password": "secret"},
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    misses = principal_cache.stats()["misses"]
+    hits = principal_cache.stats()["hits"]
+    for _ in range(3):
+        response = client.get("/users/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["user"]["username"] == "bishop"
+    assert principal_cache.stats()["misses"] == misses + 1
+    assert principal_cache.stats()["hits"] == hits + 2
+
+    response = client.put("/users/me", json={"username": "rook"}, headers=headers)
+    assert response.status_code == 200
+
+    response = client.get("/users/me", headers=headers)
+    assert response.json()["user"]["username"] == "rook"
+
+def test_get_users_chats_paginated(client, session, user_fixture, chat_fixture):
+    user = user_fixture(username="bishop", email="testemail").user
+    for name in ["c", "a", "d", "b"]:
+        chat = chat_fixture(name=name, owner_id=user.id)
+        session.add(UserChatLinkInDB(user_id=user.id, chat_id=chat.id))
+    session.commit()
+
+    response = client.get(f"/users/{user.id}/chats", params={"limit": 2, "offset": 1})
+    assert response.status_code == 200
+    assert response.json()["meta"] == {"count": 2}
+    assert [chat["name"] for chat in response.json()["chats"]] == ["b", "c"]
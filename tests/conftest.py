@@ -1,6 +1,9 @@
+import asyncio
 import pytest
+from contextlib import contextmanager
 from fastapi.testclient import TestClient
-from sqlmodel import Session, SQLModel, StaticPool, create_engine
+from sqlalchemy import event
+from sqlmodel import Session, StaticPool
 from datetime import datetime
 from backend.main import app
 from backend import database as db
@@ -8,12 +11,10 @@ from backend import auth
 
 @pytest.fixture
 def session():
-    engine = create_engine(
-        "sqlite://",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
-    )
-    SQLModel.metadata.create_all(engine)
+    engine = db.build_engine("sqlite://", poolclass=StaticPool)
+    db.create_db_and_tables(engine)
+    # tokens of a previous test's users would otherwise still resolve
+    auth.principal_cache.clear()
     with Session(engine) as session:
         yield session
 
@@ -51,14 +52,14 @@ def user_fixture(session):
         email: str = "@cool.email",
         password: str = "password",
     ) -> db.UserInDB:
-        return auth.register_new_user(
+        return asyncio.run(auth.register_new_user(
             auth.UserRegistration(
                 username=username,
                 email=email,
                 password=password,
             ),
             session,
-        )
+        ))
 
     return _build_user
 
@@ -79,4 +80,80 @@ def chat_fixture(session):
 
         return chat
 
-    return _build_chat
\ No newline at end of file
+    return _build_chat
+
+@pytest.fixture
+def client_as(session):
+    def _build_client(user) -> TestClient:
+        def _get_session_override():
+            return session
+
+        def _get_current_user_override():
+            return user
+
+        app.dependency_overrides[db.get_session] = _get_session_override
+        app.dependency_overrides[auth.get_current_user] = _get_current_user_override
+
+        return TestClient(app)
+
+    yield _build_client
+
+    app.dependency_overrides.clear()
+
+@pytest.fixture
+def member_chat_fixture(session, chat_fixture):
+    def _build_chat(user, name: str = "chat007") -> db.ChatInDB:
+        chat = chat_fixture(name=name, owner_id=user.id)
+        session.add(db.UserChatLinkInDB(user_id=user.id, chat_id=chat.id))
+        session.commit()
+        session.refresh(chat)
+
+        return chat
+
+    return _build_chat
+
+@pytest.fixture
+def message_fixture(session):
+    def _build_message(
+        chat_id: int,
+        user_id: int,
+        text: str = "hello",
+        created_at: datetime = None,
+    ) -> db.MessageInDB:
+        message = db.MessageInDB(
+            text=text,
+            chat_id=chat_id,
+            user_id=user_id,
+            created_at=created_at or datetime.now(),
+        )
+
+        session.add(message)
+        session.commit()
+        session.refresh(message)
+
+        return message
+
+    return _build_message
+
+@pytest.fixture
+def assert_max_queries(session):
+    @contextmanager
+    def _assert_max_queries(limit: int):
+        statements = []
+
+        def _record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        engine = session.get_bind()
+        event.listen(engine, "before_cursor_execute", _record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", _record)
+
+        assert len(statements) <= limit, (
+            f"{len(statements)} statements, expected at most {limit}:\n"
+            + "\n".join(statements)
+        )
+
+    return _assert_max_queries